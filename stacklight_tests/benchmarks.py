@@ -0,0 +1,148 @@
+"""Micro-benchmarks of parsers used by the clients.
+
+Run as:
+
+    python -m stacklight_tests.benchmarks exposition --size 1000000
+    python -m stacklight_tests.benchmarks alerts --size 100000
+    python -m stacklight_tests.benchmarks rfc3339 --size 100000
+"""
+import argparse
+import datetime as dt
+import itertools
+import time
+
+from stacklight_tests.clients.prometheus import alertmanager_client
+from stacklight_tests.clients.prometheus import exposition
+from stacklight_tests import utils
+
+
+def generate_exposition_page():
+    """Yield lines of synthetic exporter page with all kinds of families."""
+    buckets = ("0.005", "0.05", "0.5", "1", "5", "+Inf")
+    for n in itertools.count():
+        yield "# HELP node_counter_{0}_total Counter \\\\ number {0}".format(n)
+        yield "# TYPE node_counter_{}_total counter".format(n)
+        for cpu in range(4):
+            yield ('node_counter_{}_total{{cpu="{}",mode="user",'
+                   'path="C:\\\\dir \\"x\\""}} {}.5 1500000000000'
+                   ).format(n, cpu, n)
+        yield "# TYPE node_gauge_{} gauge".format(n)
+        yield "node_gauge_{} NaN".format(n)
+        yield "node_gauge_{}:ratio{{}} 0.5".format(n)
+        yield "# TYPE http_request_duration_seconds_{} histogram".format(n)
+        for le in buckets:
+            yield ('http_request_duration_seconds_{}_bucket{{handler="/",'
+                   'le="{}"}} {}').format(n, le, n)
+        yield ('http_request_duration_seconds_{}_sum{{handler="/"}} '
+               '1.5e+03').format(n)
+        yield ('http_request_duration_seconds_{}_count{{handler="/"}} '
+               '{}').format(n, n)
+        yield "# TYPE rpc_duration_seconds_{} summary".format(n)
+        for quantile in ("0.5", "0.9", "0.99"):
+            yield 'rpc_duration_seconds_{}{{quantile="{}"}} -Inf'.format(
+                n, quantile)
+        yield "rpc_duration_seconds_{}_sum 17".format(n)
+        yield "rpc_duration_seconds_{}_count 2".format(n)
+
+
+def benchmark_exposition(size):
+    lines = list(itertools.islice(generate_exposition_page(), size))
+    start = time.time()
+    families = 0
+    samples = 0
+    for family in exposition.iter_families(lines):
+        families += 1
+        samples += len(family.samples)
+    duration = time.time() - start
+    print("Parsed {} lines: {} families, {} samples in {:.2f}s "
+          "({:.0f} lines/s)".format(
+              len(lines), families, samples, duration, len(lines) / duration))
+
+
+def generate_alert_manager_dicts():
+    """Yield alerts in Alertmanager API format with various timestamps."""
+    for n in itertools.count():
+        yield {
+            "labels": {
+                "alertname": "Alert{}".format(n % 100),
+                "instance": "node{}:9100".format(n),
+                "host": "node{}".format(n),
+                "service": "service{}".format(n % 10),
+                "severity": "warning",
+            },
+            "annotations": {"summary": "Alert number {}".format(n)},
+            "startsAt": "2019-01-01T10:00:{:02d}.{:09d}+03:00".format(
+                n % 60, n),
+            "endsAt": ("0001-01-01T00:00:00Z" if n % 2 else
+                       "2019-01-01T11:00:00.123456789Z"),
+            "fingerprint": "{:016x}".format(n),
+        }
+
+
+def benchmark_alerts(size):
+    items = list(itertools.islice(generate_alert_manager_dicts(), size))
+    start = time.time()
+    alerts = [alertmanager_client.get_alert_from_alert_manager_dict(item)
+              for item in items]
+    created = time.time()
+    fired = sum(1 for alert in alerts if alert.is_fired)
+    parsed = time.time()
+    index = alertmanager_client.AlertIndex(alerts)
+    found = sum(len(index.find(name="Alert{}".format(n), service="service1"))
+                for n in range(100))
+    indexed = time.time()
+    start_of_fired = dt.datetime.utcnow()
+    fired_again = sum(1 for alert in alerts if alert.is_fired)
+    print("{} alerts: created in {:.2f}s, {} fired, timestamps parsed in "
+          "{:.2f}s, {} found in index in {:.2f}s, {} fired on second pass "
+          "in {:.2f}s".format(
+              len(alerts), created - start, fired, parsed - created,
+              found, indexed - parsed, fired_again,
+              (dt.datetime.utcnow() - start_of_fired).total_seconds()))
+
+
+def parse_time_strptime(timestamp):
+    """Previous parser of utils.parse_time_rfc_3339, kept for comparison."""
+    try:
+        return dt.datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%S.%fZ")
+    except ValueError:
+        return dt.datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%SZ")
+
+
+def benchmark_rfc3339(size):
+    # Only formats supported by both parsers, half of them without fraction
+    timestamps = [
+        ("2019-01-01T10:{:02d}:{:02d}.{:06d}Z" if n % 2 else
+         "2019-01-01T10:{:02d}:{:02d}Z").format(n // 60 % 60, n % 60, n)
+        for n in range(size)]
+    results = []
+    for name, parse in (("strptime", parse_time_strptime),
+                        ("regex", utils.parse_time_rfc_3339)):
+        start = time.time()
+        parsed = [parse(timestamp) for timestamp in timestamps]
+        duration = time.time() - start
+        results.append(parsed)
+        print("{}: {} timestamps in {:.2f}s ({:.0f}/s)".format(
+            name, len(timestamps), duration, len(timestamps) / duration))
+    assert results[0] == results[1]
+
+
+benchmarks = {
+    "alerts": benchmark_alerts,
+    "exposition": benchmark_exposition,
+    "rfc3339": benchmark_rfc3339,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="stacklight_tests.benchmarks")
+    parser.add_argument("name", choices=sorted(benchmarks.keys()),
+                        help="Benchmark to run")
+    parser.add_argument("--size", type=int, default=1000000,
+                        help="Size of synthetic input")
+    args = parser.parse_args()
+    benchmarks[args.name](args.size)
+
+
+if __name__ == "__main__":
+    main()
@@ -24,7 +24,8 @@ def prometheus_native_alerting(prometheus_config):
     alerting = alertmanager_client.AlertManagerClient(
         "http://{0}:{1}/".format(
             prometheus_config["prometheus_vip"],
-            prometheus_config["prometheus_alertmanager"])
+            prometheus_config["prometheus_alertmanager"]),
+        api_version=prometheus_config.get("alertmanager_api_version", "v1"),
     )
     return alerting
 
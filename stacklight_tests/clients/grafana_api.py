@@ -1,6 +1,7 @@
 import logging
 
 from stacklight_tests.clients import grafana_templates_builder
+from stacklight_tests.clients.prometheus import query_cache
 from stacklight_tests import utils
 
 
@@ -10,10 +11,11 @@ logger = logging.getLogger(__name__)
 
 
 class Dashboard(object):
-    def __init__(self, dash_dict, datasource):
+    def __init__(self, dash_dict, datasource, values_store=None):
         self.name = dash_dict["meta"]["slug"]
         self.dash_dict = dash_dict
         self._datasource = datasource
+        self._values_store = values_store
         self._templates_tree = self.get_templates_tree()
 
     def __repr__(self):
@@ -58,9 +60,9 @@ class Dashboard(object):
                         "${}".format(
                             item["name"]): (item["query"], item["regex"])})
 
-        return grafana_templates_builder.TemplatesTree(template_queries,
-                                                       self._datasource,
-                                                       defaults_update)
+        return grafana_templates_builder.TemplatesTree(
+            template_queries, self._datasource, defaults_update,
+            values_store=self._values_store)
 
     def get_all_templates_for_query(self, query):
         return self._templates_tree.get_all_templates_for_query(query)
@@ -98,6 +100,8 @@ class GrafanaApi(object):
         self.grafana_api_url = "{scheme}://{host}:{port}/api".format(
             scheme=scheme, host=address, port=port)
         self.datasource = datasource
+        # Values of templates shared by all dashboards of the client
+        self.template_values_store = query_cache.ValuesStore()
 
     def get_api_url(self, resource=""):
         return "{}{}".format(self.grafana_api_url, resource)
@@ -119,7 +123,8 @@ class GrafanaApi(object):
         raw_dashboard = self._get_raw_dashboard(name)
         if raw_dashboard:
             return Dashboard(raw_dashboard.json(),
-                             self.datasource)
+                             self.datasource,
+                             values_store=self.template_values_store)
 
     def get_all_dashboards_names(self):
         search_url = self.get_api_url("/search")
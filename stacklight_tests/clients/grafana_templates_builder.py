@@ -1,12 +1,120 @@
 import collections
 import itertools
+import random
 import re
 
+from stacklight_tests.clients.prometheus import query_cache
+from stacklight_tests import settings
 from stacklight_tests import utils
 
 
+# Strategies of combining values of templates. Every strategy takes
+# OrderedDict of template name to list of its values and lazily yields
+# combinations as dicts of template name to value.
+
+def iter_product(groups, **kwargs):
+    """All combinations of values."""
+    names = list(groups)
+    for values in itertools.product(*groups.values()):
+        yield dict(zip(names, values))
+
+
+def iter_each_value(groups, **kwargs):
+    """As many combinations as values of the largest template, so every
+    value of every template is used at least once.
+    """
+    if not all(groups.values()):
+        return
+    count = max([len(values) for values in groups.values()] or [1])
+    for n in range(count):
+        yield {name: values[n % len(values)]
+               for name, values in groups.items()}
+
+
+def iter_pairwise(groups, **kwargs):
+    """Combinations which cover every pair of values of every two
+    templates at least once, built greedily one by one.
+    """
+    names = list(groups)
+    values = list(groups.values())
+    if len(names) <= 2 or not all(values):
+        for template in iter_product(groups):
+            yield template
+        return
+    pairs = [((i, a), (j, b))
+             for i, j in itertools.combinations(range(len(names)), 2)
+             for a in range(len(values[i])) for b in range(len(values[j]))]
+    uncovered = set(pairs)
+    for (i, a), (j, b) in pairs:
+        if ((i, a), (j, b)) not in uncovered:
+            continue
+        row = [None] * len(names)
+        row[i], row[j] = a, b
+        for k in range(len(names)):
+            if row[k] is not None:
+                continue
+            # Take the value covering the most of not yet covered pairs
+            row[k] = max(
+                range(len(values[k])),
+                key=lambda v: sum(
+                    1 for m, w in enumerate(row) if w is not None and
+                    (((m, w), (k, v)) if m < k else ((k, v), (m, w)))
+                    in uncovered))
+        uncovered.difference_update(
+            ((m, row[m]), (n, row[n]))
+            for m, n in itertools.combinations(range(len(names)), 2))
+        yield {name: values[n][row[n]] for n, name in enumerate(names)}
+
+
+def iter_random(groups, sample_size=100, seed=0, **kwargs):
+    """Random sample of sample_size distinct combinations."""
+    values = list(groups.values())
+    total = 1
+    for item in values:
+        total *= len(item)
+    if total <= sample_size:
+        for template in iter_product(groups):
+            yield template
+        return
+    for index in random.Random(seed).sample(xrange(total), sample_size):
+        template = {}
+        for name, item in reversed(groups.items()):
+            index, n = divmod(index, len(item))
+            template[name] = item[n]
+        yield template
+
+
+combination_strategies = {
+    "product": iter_product,
+    "each": iter_each_value,
+    "pairwise": iter_pairwise,
+    "random": iter_random,
+}
+
+
+def iter_combinations(groups, strategy="product", **kwargs):
+    """Yield combinations of values of templates using strategy.
+
+    :param groups: dict of template name to iterable of its values
+    :param strategy: name of the strategy in combination_strategies
+    """
+    groups = collections.OrderedDict(
+        (name, sorted(values)) for name, values in sorted(groups.items()))
+    return combination_strategies[strategy](groups, **kwargs)
+
+
 class TemplatesTree(object):
-    def __init__(self, queries, datasource, append_default=None):
+    def __init__(self, queries, datasource, append_default=None,
+                 max_workers=None, values_store=None, strategy=None,
+                 sample_size=None, seed=None):
+        """
+        :param values_store: ValuesStore of template values, it can be
+         shared by trees of different dashboards
+        :param strategy: name of strategy of combining values of dependent
+         templates, see combination_strategies
+        :param sample_size: count of combinations for "random" strategy
+        :param seed: seed of "random" strategy
+        """
         if append_default is None:
             append_default = {}
         self.queries = queries
@@ -20,6 +128,16 @@ class TemplatesTree(object):
         }
         self._compile_query = datasource.compile_query
         self._do_query = datasource.do_query
+        self.max_workers = max_workers
+        if values_store is None:
+            values_store = query_cache.ValuesStore()
+        self.values_store = values_store
+        self.strategy = strategy or settings.TEMPLATES_STRATEGY
+        if self.strategy not in combination_strategies:
+            raise ValueError("Unknown templates combination strategy: "
+                             "{}".format(self.strategy))
+        self.sample_size = sample_size or settings.TEMPLATES_SAMPLE_SIZE
+        self.seed = settings.TEMPLATES_SEED if seed is None else seed
 
         self.nodes_by_level = collections.defaultdict(set)
         self.levels_by_name = collections.OrderedDict()
@@ -56,19 +174,40 @@ class TemplatesTree(object):
             self.levels_by_name[template] = curr_level
 
     def _query_values_for_template(self, template, substitutions):
+        # Values depend only on the compiled query and the regex, so
+        # parents which differ in unused variables share the result
         query = self._compile_query(self.queries[template][0], substitutions)
+        regex = self.queries[template][1]
         try:
-            values = self._do_query(query, regex=self.queries[template][1])
+            values = self.values_store.get_or_call(
+                query, lambda: self._do_query(query, regex=regex),
+                variant=regex)
         except KeyError:
             values = []
         return values
 
-    def _fill_top_level(self):
-        for dep_name in self.levels_by_name.keys():
-            parent = None
-            values = self._query_values_for_template(dep_name, {})
+    def _add_templates_concurrently(self, work_list):
+        """Query values for (template name, parent node) pairs concurrently
+        and add them to the tree in order of work_list.
+        """
+        def query_values(item):
+            name, parent = item
+            substitutions = {}
+            if parent is not None:
+                substitutions = parent.get_full_template()
+            return self._query_values_for_template(name, substitutions)
+
+        results = utils.map_concurrently(
+            query_values, work_list, max_workers=self.max_workers)
+        for (name, parent), (values, error) in zip(work_list, results):
+            if error is not None:
+                raise error
             for value in values:
-                self.add_template(value, dep_name, parent)
+                self.add_template(value, name, parent)
+
+    def _fill_top_level(self):
+        self._add_templates_concurrently(
+            [(dep_name, None) for dep_name in self.levels_by_name.keys()])
 
     def _build(self):
         """Fill tree with all possible values for _templates_tree.
@@ -85,15 +224,19 @@ class TemplatesTree(object):
            172.16.10.101     v         v     172.16.10.102
                           glance  keystone-keys
 
+        Templates of the same level don't depend on each other, so levels
+        are filled one by one and all queries of a level are run
+        concurrently.
         """
         self._fill_top_level()
+        names_by_level = collections.defaultdict(list)
         for name, level in self.levels_by_name.items()[1:]:
-            parents = self.get_closest_parents(self.dependencies[name])
-            for parent in parents:
-                substitutions = parent.get_full_template()
-                values = self._query_values_for_template(name, substitutions)
-                for value in values:
-                    self.add_template(value, name, parent)
+            names_by_level[level].append(name)
+        for level in sorted(names_by_level):
+            self._add_templates_concurrently(
+                [(name, parent) for name in names_by_level[level]
+                 for parent in self.get_closest_parents(
+                     self.dependencies[name])])
 
     def get_nodes_on_level(self, level):
         return self.nodes_by_level[level]
@@ -126,28 +269,32 @@ class TemplatesTree(object):
         self.nodes_by_level[new_node.level].add(new_node)
 
     def get_all_templates_for_query(self, query):
+        """Lazily yield templates to compile query with.
+
+        Values of templates with the same parent are combined using the
+        strategy of the tree.
+        """
         dependencies = [dep for dep in self.parse_dependencies(query)
                         if dep not in self.default_templates]
         if not dependencies:
-            return [self.default_templates]
+            yield self.default_templates
+            return
         dep_nodes = self.get_closest_parents(dependencies)
         groups = {node.name for node in dep_nodes}
         if len(groups) > 1:
             parents = {node.parent
                        for node in dep_nodes
                        if node.parent is not None}
-
-            if not parents:
-                templates = [node.get_full_template() for node in dep_nodes]
-
-            templates = \
-                list(itertools.chain(*[parent.get_templates_with_children()
-                                       for parent in parents]))
+            templates = itertools.chain.from_iterable(
+                parent.get_templates_with_children(
+                    self.strategy, sample_size=self.sample_size,
+                    seed=self.seed)
+                for parent in parents)
         else:
-            templates = [node.get_full_template() for node in dep_nodes]
+            templates = (node.get_full_template() for node in dep_nodes)
         for template in templates:
             template.update(self.default_templates)
-        return templates
+            yield template
 
 
 class DepNode(object):
@@ -178,15 +325,17 @@ class DepNode(object):
         template[self.name] = self.value
         return template
 
-    def get_templates_with_children(self):
+    def get_templates_with_children(self, strategy="product", **kwargs):
+        """Lazily yield templates combining values of children.
+
+        :param strategy: name of strategy in combination_strategies,
+         kwargs are passed to it
+        """
         base_template = self.get_full_template()
         children_groups = collections.defaultdict(set)
         for child in self.children:
             children_groups[child.name].add(child.value)
-        templates = []
-        for item in itertools.product(*children_groups.values()):
+        for item in iter_combinations(children_groups, strategy, **kwargs):
             template = base_template.copy()
-            for n, key in enumerate(children_groups.keys()):
-                template[key] = item[n]
-            templates.append(template)
-        return templates
+            template.update(item)
+            yield template
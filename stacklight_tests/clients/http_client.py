@@ -1,19 +1,34 @@
 import logging
+import threading
 import urlparse
 
 import requests
 
+from stacklight_tests import settings
+
 
 logger = logging.getLogger(__name__)
 
 
 class HttpClient(object):
+    # Session is shared by all clients, so calls to the same VIP reuse
+    # already established keep-alive connections from per-host pools.
+    _session = None
+    _session_lock = threading.Lock()
+
     def __init__(self, base_url=None, verify=False, user=None, password=None):
         self.base_url = base_url
         self.kwargs = {"verify": verify}
         if user is not None and password is not None:
             self.kwargs.update({"auth": (user, password)})
 
+    @classmethod
+    def get_session(cls):
+        with cls._session_lock:
+            if HttpClient._session is None:
+                HttpClient._session = make_session()
+        return HttpClient._session
+
     def set_base_url(self, base_url):
         self.base_url = base_url
 
@@ -25,14 +40,36 @@ class HttpClient(object):
             headers = {'Content-Type': 'application/json'}
 
         kwargs.update(self.kwargs)
-        r = requests.request(method, urlparse.urljoin(self.base_url, url),
-                             headers=headers, data=body, **kwargs)
+        r = self.get_session().request(
+            method, urlparse.urljoin(self.base_url, url),
+            headers=headers, data=body, **kwargs)
 
         if not r.ok:
             raise requests.HTTPError(r.content)
         logger.debug(r.content)
         return r.headers, r.content
 
+    def stream(self, url, method="GET", headers=None, body=None,
+               chunk_size=64 * 1024, **kwargs):
+        """Send request and yield chunks of response body as they arrive."""
+        logger.debug(
+            "Streaming request to: {}, body: {}, headers: {}, "
+            "kwargs: {}".format(url, body, headers, kwargs))
+        if headers is None:
+            headers = {'Content-Type': 'application/json'}
+
+        kwargs.update(self.kwargs)
+        r = self.get_session().request(
+            method, urlparse.urljoin(self.base_url, url),
+            headers=headers, data=body, stream=True, **kwargs)
+        try:
+            if not r.ok:
+                raise requests.HTTPError(r.content)
+            for chunk in r.iter_content(chunk_size):
+                yield chunk
+        finally:
+            r.close()
+
     def post(self, url, body=None, **kwargs):
         return self.request(url, "POST", body=body, **kwargs)
 
@@ -44,3 +81,21 @@ class HttpClient(object):
 
     def delete(self, url, **kwargs):
         return self.request(url, "DELETE", **kwargs)
+
+
+def make_session(pool_connections=None, pool_maxsize=None):
+    """Create a keep-alive session with gzip negotiation.
+
+    :param pool_connections: number of per-host pools to keep
+    :param pool_maxsize: number of connections kept in each per-host pool
+    """
+    if pool_connections is None:
+        pool_connections = settings.HTTP_POOL_CONNECTIONS
+    if pool_maxsize is None:
+        pool_maxsize = settings.HTTP_POOL_MAXSIZE
+    session = requests.Session()
+    session.headers.update({"Accept-Encoding": "gzip, deflate"})
+    for scheme in ("http://", "https://"):
+        session.mount(scheme, requests.adapters.HTTPAdapter(
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize))
+    return session
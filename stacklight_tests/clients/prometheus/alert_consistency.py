@@ -0,0 +1,123 @@
+import collections
+import datetime as dt
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+AlertsDelta = collections.namedtuple(
+    "AlertsDelta", ["alertmanager_added", "alertmanager_removed",
+                    "alerta_added", "alerta_removed"])
+
+
+class AlertConsistencyChecker(object):
+    """Incrementally compare active alerts of Alertmanager and Alerta.
+
+    Both sides are kept as sets keyed by Alertmanager fingerprints and
+    Alerta ids. Start time of Alertmanager alert is parsed once, when its
+    fingerprint is seen for the first time. Alerta is asked only for
+    alerts received since the previous update, closed ones are removed,
+    and fully resynchronized every "full_sync_every" updates to catch
+    alerts expired without receiving anything.
+
+    Alerts are compared by "<alertname> <instance>" of Alertmanager alert
+    and "<event> <resource>" of Alerta alert.
+    """
+    # Alerts received while the previous query was in progress may have
+    # receive time before it was sent
+    sync_margin = dt.timedelta(seconds=60)
+
+    def __init__(self, alertmanager_api, alerta_api, min_age=300,
+                 full_sync_every=10):
+        """
+        :param min_age: seconds after start of Alertmanager alert, when it
+         should already be in Alerta
+        """
+        self.alertmanager_api = alertmanager_api
+        self.alerta_api = alerta_api
+        self.min_age = dt.timedelta(seconds=min_age)
+        self.full_sync_every = full_sync_every
+        self.alertmanager_alerts = {}
+        self.alerta_alerts = {}
+        self._updates_count = 0
+        self._alerta_synced_at = None
+
+    @staticmethod
+    def _get_alertmanager_id(alert):
+        return (getattr(alert, "fingerprint", None) or
+                (alert.name, alert.instance, alert.time))
+
+    def _update_alertmanager(self):
+        current = {}
+        added = set()
+        for alert in self.alertmanager_api.list_alerts():
+            alert_id = self._get_alertmanager_id(alert)
+            known = self.alertmanager_alerts.get(alert_id)
+            if known is None:
+                known = ("{0} {1}".format(alert.name, alert.instance),
+                         alert.started_at)
+                added.add(known[0])
+            current[alert_id] = known
+        removed = {key for alert_id, (key, _) in
+                   self.alertmanager_alerts.items() if alert_id not in current}
+        self.alertmanager_alerts = current
+        return added, removed
+
+    def _update_alerta(self):
+        full_sync = (self._alerta_synced_at is None or
+                     self._updates_count % self.full_sync_every == 0)
+        synced_at = dt.datetime.utcnow()
+        if full_sync:
+            alerts = self.alerta_api.get_alerts({"status": "open"})
+            previous = self.alerta_alerts
+            self.alerta_alerts = {
+                alert.id: "{0} {1}".format(alert.event, alert.resource)
+                for alert in alerts}
+            added = set(self.alerta_alerts.values()) - set(previous.values())
+            removed = set(previous.values()) - set(self.alerta_alerts.values())
+        else:
+            from_date = self._alerta_synced_at - self.sync_margin
+            alerts = self.alerta_api.get_alerts({
+                "from-date": "{}.{:03d}Z".format(
+                    from_date.strftime("%Y-%m-%dT%H:%M:%S"),
+                    from_date.microsecond // 1000)})
+            added = set()
+            removed = set()
+            for alert in alerts:
+                key = "{0} {1}".format(alert.event, alert.resource)
+                if alert.status == "open":
+                    if alert.id not in self.alerta_alerts:
+                        added.add(key)
+                    self.alerta_alerts[alert.id] = key
+                elif self.alerta_alerts.pop(alert.id, None) is not None:
+                    removed.add(key)
+        self._alerta_synced_at = synced_at
+        return added, removed
+
+    def update(self):
+        """Fetch changes of both sides.
+
+        :returns: AlertsDelta of keys added and removed since the previous
+         update
+        """
+        alertmanager_added, alertmanager_removed = self._update_alertmanager()
+        alerta_added, alerta_removed = self._update_alerta()
+        self._updates_count += 1
+        return AlertsDelta(alertmanager_added, alertmanager_removed,
+                           alerta_added, alerta_removed)
+
+    def get_missing_in_alerta(self):
+        """Return keys of Alertmanager alerts older than min_age, which are
+        not in Alerta.
+        """
+        deadline = dt.datetime.utcnow() - self.min_age
+        alerta_keys = set(self.alerta_alerts.values())
+        return {key for key, started_at in self.alertmanager_alerts.values()
+                if started_at < deadline and key not in alerta_keys}
+
+    def get_missing_in_alertmanager(self):
+        """Return keys of Alerta alerts, which are not in Alertmanager."""
+        alertmanager_keys = {key for key, _ in
+                             self.alertmanager_alerts.values()}
+        return set(self.alerta_alerts.values()) - alertmanager_keys
@@ -0,0 +1,189 @@
+import collections
+import datetime as dt
+import logging
+import time
+
+from stacklight_tests.clients.prometheus import alertmanager_client
+from stacklight_tests import custom_exceptions as exceptions
+from stacklight_tests import utils
+
+
+logger = logging.getLogger(__name__)
+
+
+class AlertLatencyRecord(object):
+    """Times of stages of one alert after the fault, in unix seconds."""
+    __slots__ = ("criteria", "fault_time", "stages")
+
+    def __init__(self, criteria, fault_time):
+        self.criteria = criteria
+        self.fault_time = fault_time
+        self.stages = collections.OrderedDict(
+            (stage, None) for stage in AlertLatencyTracker.stages)
+
+    @property
+    def name(self):
+        return self.criteria.get("name")
+
+    def get_latencies(self):
+        return collections.OrderedDict(
+            (stage, None if ts is None else ts - self.fault_time)
+            for stage, ts in self.stages.items())
+
+
+class AlertLatencyTracker(utils.ConditionsWatcher):
+    """Measure latency of every stage of alert pipeline after a fault.
+
+    Stages are: the first pending sample of ALERTS in Prometheus, the first
+    firing sample of ALERTS, arrival of the alert to Alertmanager and to
+    Alerta. Prometheus stages are taken from a range query of ALERTS over
+    the time since the fault, so their precision is "resolution" seconds.
+    Arrival to Alertmanager is precise up to the polling interval, so the
+    tracker should be polled from the start, e.g. passed as a companion to
+    check_alert_status. For Alerta the creation time of the alert opened
+    after the fault is used.
+    """
+    stages = ("pending", "firing", "alertmanager", "alerta")
+
+    def __init__(self, prometheus_api, alertmanager_api=None, alerta_api=None,
+                 interval=5, timeout=10 * 60, resolution=5):
+        super(AlertLatencyTracker, self).__init__(interval, timeout)
+        self.prometheus_api = prometheus_api
+        self.alertmanager_api = alertmanager_api
+        self.alerta_api = alerta_api
+        self.resolution = resolution
+        self.records = []
+
+    def mark_fault(self, criteria, fault_time=None):
+        """Register the fault which should cause alert with criteria.
+
+        :param criteria: alert criteria as in check_alert_status
+        :param fault_time: unix time of the fault, defaults to now
+        """
+        record = AlertLatencyRecord(
+            criteria, time.time() if fault_time is None else fault_time)
+        self.records.append(record)
+        self.add_condition(len(self.records) - 1, record)
+        return record
+
+    def _get_required_stages(self):
+        required = ["firing"]
+        if self.alertmanager_api is not None:
+            required.append("alertmanager")
+        if self.alerta_api is not None:
+            required.append("alerta")
+        return required
+
+    def _update_prometheus_stages(self, record):
+        matchers = alertmanager_client.get_label_matchers(record.criteria)
+        query = "ALERTS{{{}}}".format(",".join(matchers))
+        start = int(record.fault_time)
+        end = max(int(time.time()), start + 1)
+        for item in self.prometheus_api.get_query_range(
+                query, start, end, self.resolution):
+            stage = item.labels.get("alertstate")
+            if stage not in ("pending", "firing") or not len(item):
+                continue
+            first_seen = item.timestamps[0]
+            if (record.stages[stage] is None or
+                    first_seen < record.stages[stage]):
+                record.stages[stage] = first_seen
+
+    @staticmethod
+    def _update_alertmanager_stage(record, index, now):
+        alert = index.get_alert_by_filter(**record.criteria)
+        if alert is not None and alert.is_fired:
+            record.stages["alertmanager"] = now
+
+    @staticmethod
+    def _is_alerta_alert_appropriate(alert, criteria):
+        # Alerta keeps instance as resource and other labels as tags
+        if "service" in criteria and criteria["service"] not in alert.service:
+            return False
+        if "instance" in criteria and criteria["instance"] != alert.resource:
+            return False
+        if "host" in criteria:
+            host = criteria["host"]
+            if (alert.resource.split(":")[0] != host and
+                    "host={}".format(host) not in alert.tags):
+                return False
+        return True
+
+    def _update_alerta_stage(self, record):
+        fault_dt = dt.datetime.utcfromtimestamp(record.fault_time)
+        query = {"event": record.name, "status": "open"}
+        if "service" in record.criteria:
+            query["service"] = record.criteria["service"]
+        for alert in self.alerta_api.get_alerts(query):
+            # Only the alert opened after the fault is caused by it, alerts
+            # open before are received again on every repeat interval
+            if (alert.create_time is None or alert.create_time < fault_dt or
+                    not self._is_alerta_alert_appropriate(
+                        alert, record.criteria)):
+                continue
+            ts = (record.fault_time +
+                  (alert.create_time - fault_dt).total_seconds())
+            if (record.stages["alerta"] is None or
+                    ts < record.stages["alerta"]):
+                record.stages["alerta"] = ts
+
+    def _get_satisfied(self, pending):
+        now = time.time()
+        required = self._get_required_stages()
+        index = None
+        if self.alertmanager_api is not None and any(
+                record.stages["alertmanager"] is None
+                for record in pending.values()):
+            # All records are looked up in one snapshot of alerts
+            index = self.alertmanager_api.get_alert_index()
+        satisfied = []
+        for key, record in pending.items():
+            if record.stages["firing"] is None:
+                self._update_prometheus_stages(record)
+            if index is not None and record.stages["alertmanager"] is None:
+                self._update_alertmanager_stage(record, index, now)
+            if (self.alerta_api is not None and
+                    record.stages["alerta"] is None):
+                self._update_alerta_stage(record)
+            if all(record.stages[stage] is not None for stage in required):
+                satisfied.append(key)
+        return satisfied
+
+    def _format_pending(self, pending):
+        return "\n".join(
+            "{} has no stages: {}".format(
+                record.criteria,
+                ", ".join(stage for stage in self._get_required_stages()
+                          if record.stages[stage] is None))
+            for record in pending.values())
+
+    def collect(self, timeout=None):
+        """Wait for stages of all marked faults without failing the test.
+
+        Latency is measured on the best-effort basis, so stages which
+        haven't happened within timeout are only logged.
+        """
+        try:
+            self.wait(timeout_msg="Not all alert pipeline stages happened",
+                      timeout=timeout)
+        except exceptions.TimeoutError as e:
+            logger.warning("Alert latency is measured partially: {}".format(
+                e))
+        return self.get_report()
+
+    def get_report(self):
+        """Return latencies of stages in seconds grouped by alert name."""
+        report = collections.defaultdict(list)
+        for record in self.records:
+            report[record.name].append(record.get_latencies())
+        return dict(report)
+
+    def format_report(self):
+        row = "{:<40} {:>10} {:>10} {:>14} {:>10}"
+        lines = [row.format("Alert", *self.stages)]
+        for record in self.records:
+            latencies = ["n/a" if latency is None
+                         else "{:.1f}s".format(latency)
+                         for latency in record.get_latencies().values()]
+            lines.append(row.format(record.name, *latencies))
+        return "\n".join(lines)
@@ -1,5 +1,12 @@
+import collections
+import contextlib
+import datetime as dt
 import json
 import logging
+import operator
+import sys
+
+import six
 
 from stacklight_tests.clients import http_client
 from stacklight_tests.clients.prometheus import prometheus_client
@@ -8,11 +15,98 @@ from stacklight_tests import utils
 
 logger = logging.getLogger(__name__)
 
+RFC_3339_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+
+
+# Mapping of Alert attributes to labels, which can be matched on server side
+label_by_attr = {
+    "name": "alertname",
+    "host": "host",
+    "service": "service",
+    "severity": "severity",
+    "instance": "instance",
+}
+
+
+def get_label_matchers(criteria):
+    """Convert alert criteria to list of equality label matchers.
+
+    Criteria for attributes which are not labels are skipped.
+    """
+    matchers = []
+    for attr, value in sorted(criteria.items()):
+        label = label_by_attr.get(attr)
+        if label is None or not isinstance(value, basestring):
+            continue
+        value = value.replace("\\", "\\\\").replace('"', '\\"')
+        matchers.append('{}="{}"'.format(label, value))
+    return matchers
+
+
+def get_silence_matchers(criteria):
+    """Convert alert criteria to matchers of Alertmanager silence.
+
+    Attributes are mapped to labels as in get_label_matchers, unknown
+    attributes are used as label names as is.
+    """
+    matchers = []
+    for attr, value in sorted(criteria.items()):
+        is_regex = hasattr(value, "pattern")
+        matchers.append({
+            "name": label_by_attr.get(attr, attr),
+            "value": value.pattern if is_regex else value,
+            "isRegex": is_regex,
+        })
+    return matchers
+
+
+class AlertIndex(object):
+    """Hash index over one snapshot of alerts.
+
+    Alerts are indexed by values of indexed_attrs. Lookup intersects sets
+    of alerts with values of all indexed criteria, so it touches only
+    alerts matching all of them, and found alerts are memoized by the
+    whole criteria, so repeated lookups take constant time.
+    """
+    indexed_attrs = ("name", "service", "host", "severity", "instance")
+
+    def __init__(self, alerts):
+        self.alerts = list(alerts)
+        self._index = {attr: collections.defaultdict(set)
+                       for attr in self.indexed_attrs}
+        for n, alert in enumerate(self.alerts):
+            for attr in self.indexed_attrs:
+                self._index[attr][getattr(alert, attr)].add(n)
+        self._found = {}
+
+    def __len__(self):
+        return len(self.alerts)
+
+    def _find(self, criteria):
+        buckets = sorted(
+            (self._index[attr].get(value, ())
+             for attr, value in criteria.items() if attr in self._index),
+            key=len)
+        if buckets:
+            positions = set(buckets[0]).intersection(*buckets[1:])
+            candidates = [self.alerts[n] for n in sorted(positions)]
+        else:
+            candidates = self.alerts
+        other_criteria = {attr: value for attr, value in criteria.items()
+                          if attr not in self._index}
+        return tuple(alert for alert in candidates
+                     if alert.is_appropriate(**other_criteria))
+
+    def find(self, **criteria):
+        """Return all alerts matching criteria in snapshot order."""
+        key = tuple(sorted(criteria.items()))
+        found = self._found.get(key)
+        if found is None:
+            found = self._found[key] = self._find(criteria)
+        return list(found)
 
-class AlertBehaviorMixin(object):
     def get_alert_by_filter(self, **criteria):
-        alerts = [alert for alert in self.list_alerts()
-                  if alert.is_appropriate(**criteria)]
+        alerts = self.find(**criteria)
         if alerts:
             return alerts[0]
         return None
@@ -24,8 +118,33 @@ class AlertBehaviorMixin(object):
             return False
         return alert.is_fired
 
-    def check_alert_status(self, criteria, is_fired=True, timeout=5 * 60):
+
+class AlertBehaviorMixin(object):
+    def get_alert_index(self, **criteria):
+        """Return AlertIndex over the current snapshot of alerts.
+
+        :param criteria: if set, only alerts with matching labels are
+         listed
+        """
+        return AlertIndex(self.list_alerts(**criteria))
+
+    def get_alert_by_filter(self, **criteria):
+        return self.get_alert_index(**criteria).get_alert_by_filter(
+            **criteria)
+
+    def get_alert_status(self, criteria):
+        return self.get_alert_index(**criteria).get_alert_status(criteria)
+
+    def check_alert_status(self, criteria, is_fired=True, timeout=5 * 60,
+                           companions=()):
+        """Wait for alert to reach expected state.
+
+        :param companions: watchers polled on every check, e.g.
+         AlertLatencyTracker, which measures stages of the same alert
+        """
         def check():
+            for companion in companions:
+                companion.poll()
             logger.debug("Awaiting alert {} is{} fired.".format(
                 criteria, " not" if not is_fired else ""))
             status = self.get_alert_status(criteria)
@@ -35,8 +154,77 @@ class AlertBehaviorMixin(object):
         msg = "Alert status was not changed."
         return utils.wait(check, timeout=timeout, timeout_msg=msg)
 
+    def get_alert_status_watcher(self, interval=5, timeout=5 * 60):
+        return AlertStatusWatcher(self, interval=interval, timeout=timeout)
+
+    def check_alerts_statuses(self, expectations, timeout=5 * 60,
+                              interval=5, companions=()):
+        """Wait for many alerts to reach expected states at once.
+
+        :param expectations: iterable of (criteria, is_fired) pairs
+        :param companions: watchers polled on every tick, see
+         check_alert_status
+        :returns: list with count of seconds every alert took to reach
+         its state, in the same order as expectations
+        """
+        watcher = self.get_alert_status_watcher(
+            interval=interval, timeout=timeout)
+        keys = [watcher.add(criteria, is_fired)
+                for criteria, is_fired in expectations]
+        satisfied_after = watcher.wait(
+            timeout_msg="Alert status was not changed",
+            companions=companions)
+        return [satisfied_after[key] for key in keys]
+
+
+class AlertStatusWatcher(utils.ConditionsWatcher):
+    """Wait until many alerts reach expected states.
+
+    Alerts are listed once per tick and all pending criteria are checked
+    against the same AlertIndex snapshot.
+    """
+    def __init__(self, client, interval=5, timeout=5 * 60):
+        super(AlertStatusWatcher, self).__init__(interval, timeout)
+        self.client = client
+
+    def add(self, criteria, is_fired=True):
+        key = (tuple(sorted(criteria.items())), is_fired)
+        self.add_condition(key, criteria)
+        return key
+
+    def _get_satisfied(self, pending):
+        index = self.client.get_alert_index()
+        satisfied = []
+        for (criteria_items, is_fired), criteria in pending.items():
+            status = index.get_alert_status(criteria)
+            logger.debug("Alert {} is{} fired, awaiting it is{} fired.".format(
+                criteria, " not" if not status else "",
+                " not" if not is_fired else ""))
+            if status == is_fired:
+                satisfied.append((criteria_items, is_fired))
+        return satisfied
+
+    def _format_pending(self, pending):
+        return "\n".join(
+            "{} is{} fired".format(criteria, " not" if not is_fired else "")
+            for (_, is_fired), criteria in pending.items())
+
 
 class AlertManagerClient(AlertBehaviorMixin, http_client.HttpClient):
+    def __init__(self, base_url=None, verify=False, user=None, password=None,
+                 api_version="v1"):
+        """Alertmanager API client.
+
+        :param api_version: version of alerts API to use, "v1" or "v2"
+        """
+        super(AlertManagerClient, self).__init__(
+            base_url, verify=verify, user=user, password=password)
+        if api_version not in ("v1", "v2"):
+            raise ValueError(
+                "Unsupported Alertmanager API version: {}".format(
+                    api_version))
+        self.api_version = api_version
+
     def get_status(self):
         _, resp = self.get("/api/v1/status")
         status = json.loads(resp)
@@ -47,11 +235,24 @@ class AlertManagerClient(AlertBehaviorMixin, http_client.HttpClient):
         status = json.loads(resp)
         return status["data"]
 
-    def list_alerts(self):
-        _, resp = self.get("/api/v1/alerts")
-        status = json.loads(resp)
-        return [get_alert_from_alert_manager_dict(item)
-                for item in status["data"]]
+    def list_alerts(self, **criteria):
+        """List alerts, which labels match criteria.
+
+        Criteria are sent to Alertmanager as label matchers, so alerts
+        are filtered on server side.
+        """
+        matchers = get_label_matchers(criteria)
+        if self.api_version == "v2":
+            params = {"filter": matchers} if matchers else {}
+            _, resp = self.get("/api/v2/alerts", params=params)
+            items = json.loads(resp)
+        else:
+            params = {}
+            if matchers:
+                params["filter"] = "{{{}}}".format(",".join(matchers))
+            _, resp = self.get("/api/v1/alerts", params=params)
+            items = json.loads(resp)["data"]
+        return [get_alert_from_alert_manager_dict(item) for item in items]
 
     # def add_alert(self):
     #     return self.post("/api/v1/alerts")
@@ -61,14 +262,102 @@ class AlertManagerClient(AlertBehaviorMixin, http_client.HttpClient):
         status = json.loads(resp)
         return status["data"]
 
-    # def add_silence(self):
-    #     return self.post("/api/v1/silences")
+    def add_silence(self, criteria, duration=60 * 60, comment="",
+                    created_by="stacklight-pytest"):
+        """Silence alerts matching criteria for duration seconds.
+
+        :param criteria: alert criteria as in list_alerts, values of
+         compiled regular expressions become regex matchers
+        :returns: id of the created silence
+        """
+        now = dt.datetime.utcnow()
+        body = json.dumps({
+            "matchers": get_silence_matchers(criteria),
+            "startsAt": now.strftime(RFC_3339_FORMAT),
+            "endsAt": (now + dt.timedelta(seconds=duration)).strftime(
+                RFC_3339_FORMAT),
+            "createdBy": created_by,
+            "comment": comment or "Silenced by stacklight-pytest",
+        })
+        if self.api_version == "v2":
+            _, resp = self.post("/api/v2/silences", body=body)
+            return json.loads(resp)["silenceID"]
+        _, resp = self.post("/api/v1/silences", body=body)
+        return json.loads(resp)["data"]["silenceId"]
+
+    def add_silences(self, criteria_list, duration=60 * 60, comment="",
+                     max_workers=None):
+        """Create silences for many criteria concurrently.
+
+        If some of silences can't be created, created ones are expired
+        and the first error is raised. Failure to expire them is only
+        logged.
+
+        :returns: list of silence ids in the same order as criteria_list
+        """
+        results = utils.map_concurrently(
+            lambda criteria: self.add_silence(
+                criteria, duration=duration, comment=comment),
+            criteria_list, max_workers=max_workers)
+        errors = [error for _, error in results if error is not None]
+        if errors:
+            self._expire_silences(
+                [silence_id for silence_id, error in results
+                 if error is None], max_workers=max_workers)
+            raise errors[0]
+        return [silence_id for silence_id, _ in results]
 
     def get_silence(self, silence_id):
-        return self.get("/api/v1/silence/{}".format(silence_id))
+        return self.get("/api/{}/silence/{}".format(
+            self.api_version, silence_id))
 
     def delete_silence(self, silence_id):
-        return self.delete("/api/v1/silence/{}".format(silence_id))
+        return self.delete("/api/{}/silence/{}".format(
+            self.api_version, silence_id))
+
+    def _expire_silences(self, silence_ids, max_workers=None):
+        """Expire many silences concurrently and log failures.
+
+        :returns: list of errors of silences which weren't expired
+        """
+        results = utils.map_concurrently(
+            self.delete_silence, silence_ids, max_workers=max_workers)
+        errors = []
+        for silence_id, (_, error) in zip(silence_ids, results):
+            if error is not None:
+                logger.error("Failed to expire silence {}: {}".format(
+                    silence_id, error))
+                errors.append(error)
+        return errors
+
+    def expire_silences(self, silence_ids, max_workers=None):
+        """Expire many silences concurrently.
+
+        All silences are tried, the first error is raised afterwards.
+        """
+        errors = self._expire_silences(silence_ids, max_workers=max_workers)
+        if errors:
+            raise errors[0]
+
+    @contextlib.contextmanager
+    def silenced(self, criteria_list, duration=60 * 60, comment="",
+                 max_workers=None):
+        """Silence alerts matching any of criteria within the block.
+
+        Duration limits silences if expiring them fails at the end. If the
+        block raises, failure to expire silences is only logged and the
+        original error is raised.
+        """
+        silence_ids = self.add_silences(
+            criteria_list, duration=duration, comment=comment,
+            max_workers=max_workers)
+        try:
+            yield silence_ids
+        except Exception:
+            exc_info = sys.exc_info()
+            self._expire_silences(silence_ids, max_workers=max_workers)
+            six.reraise(*exc_info)
+        self.expire_silences(silence_ids, max_workers=max_workers)
 
 
 class PrometheusQueryAlertClient(AlertBehaviorMixin,
@@ -101,15 +390,38 @@ class PrometheusQueryAlertClient(AlertBehaviorMixin,
                     (unique_alerts[alert].value + alert.value) / 2)
         return unique_alerts.values()
 
-    def list_alerts(self):
-        data = self.get_query("ALERTS")
+    def list_alerts(self, **criteria):
+        """List firing alerts, which labels match criteria."""
+        matchers = ['alertstate="firing"'] + get_label_matchers(criteria)
+        data = self.iter_query("ALERTS{{{}}}".format(",".join(matchers)))
         data = self._remove_pending_alerts(data)
         alerts = [get_alert_from_query_dict(item) for item in data]
         alerts = self._merge_duplicates(alerts)
         return alerts
 
+    def get_alert_timeline(self, start, end, step, **criteria):
+        """Reconstruct states of alerts over time window.
+
+        ALERTS and ALERTS_FOR_STATE series, which labels match criteria,
+        are fetched with one range query, so precision of intervals is
+        the step.
+
+        :param start: unix timestamp of window start
+        :param end: unix timestamp of window end
+        :param step: resolution in seconds
+        :returns: AlertTimeline
+        """
+        matchers = (['__name__=~"ALERTS|ALERTS_FOR_STATE"'] +
+                    get_label_matchers(criteria))
+        result = self.get_query_range(
+            "{{{}}}".format(",".join(matchers)), start, end, step)
+        return AlertTimeline.from_series(result, start, end, step)
+
 
 class Alert(object):
+    __slots__ = ("name", "time", "host", "service", "severity", "instance",
+                 "value", "annotations")
+
     def __init__(self, name, time, host, service, severity, instance,
                  value=None, annotations=None):
         self.name = name
@@ -121,6 +433,10 @@ class Alert(object):
         self.value = value
         self.annotations = annotations
 
+    def __repr__(self):
+        return "{}: {} (host: {}, service: {})".format(
+            self.__class__.__name__, self.name, self.host, self.service)
+
     def is_appropriate(self, **criteria):
         for attr, value in criteria.items():
             if not getattr(self, attr) == value:
@@ -129,31 +445,53 @@ class Alert(object):
 
 
 class AlertManagerAlert(Alert):
-    started_at = None
-    ended_at = None
+    __slots__ = ("fingerprint", "state", "_started_at", "_ended_at")
+
+    def __init__(self, name, time, host, service, severity, instance,
+                 value=None, annotations=None, fingerprint=None, state=None):
+        super(AlertManagerAlert, self).__init__(
+            name, time, host, service, severity, instance,
+            value=value, annotations=annotations)
+        self.fingerprint = fingerprint
+        self.state = state
+        self._started_at = None
+        self._ended_at = None
+
+    def _parse_time(self):
+        started_at, ended_at = self.time
+        self._started_at = utils.parse_time_rfc_3339(started_at)
+        self._ended_at = utils.parse_time_rfc_3339(ended_at)
+
+    @property
+    def started_at(self):
+        if self._started_at is None:
+            self._parse_time()
+        return self._started_at
+
+    @property
+    def ended_at(self):
+        if self._ended_at is None:
+            self._parse_time()
+        return self._ended_at
 
     @property
     def is_fired(self):
-        if self.started_at is None:
-            started_at, ended_at = self.time
-            self.started_at = utils.parse_time_rfc_3339(started_at)
-            self.ended_at = utils.parse_time_rfc_3339(ended_at)
-        return self.ended_at < self.started_at
+        # Alertmanager sets end of active alerts either to zero time or to
+        # the time in the future when the alert is resolved if not updated
+        return (self.ended_at < self.started_at or
+                self.ended_at > dt.datetime.utcnow())
 
 
 class PrometheusQueryAlert(Alert):
+    __slots__ = ()
     valuable_attrs = ("name", "host", "service")
+    _get_key = operator.attrgetter(*valuable_attrs)
 
     def __hash__(self):
-        unique_string = "".join(getattr(self, attr)
-                                for attr in self.valuable_attrs)
-        return hash(unique_string)
+        return hash(self._get_key(self))
 
     def __eq__(self, other):
-        for attr in self.valuable_attrs:
-            if getattr(self, attr) != getattr(other, attr):
-                return False
-        return True
+        return self._get_key(self) == self._get_key(other)
 
     def __ne__(self, other):
         return not self == other
@@ -163,6 +501,126 @@ class PrometheusQueryAlert(Alert):
         return self.value
 
 
+class AlertInterval(object):
+    """Continuous period of time when the alert was in one state.
+
+    Start and end are unix times of the first and the last sample of the
+    period. Resolved intervals are followed by absence of the alert rather
+    than by another state. Active at is the time when the alert became
+    pending as reported by ALERTS_FOR_STATE, if it's available.
+    """
+    __slots__ = ("labels", "state", "start", "end", "resolved", "active_at")
+
+    def __init__(self, labels, state, start, end, resolved=False,
+                 active_at=None):
+        self.labels = labels
+        self.state = state
+        self.start = start
+        self.end = end
+        self.resolved = resolved
+        self.active_at = active_at
+
+    def __repr__(self):
+        return "{}: {} {} [{} - {}]{}".format(
+            self.__class__.__name__, self.name, self.state, self.start,
+            self.end, " resolved" if self.resolved else "")
+
+    @property
+    def name(self):
+        return self.labels.get("alertname")
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+    def is_appropriate(self, **criteria):
+        for attr, value in criteria.items():
+            if attr == "state":
+                actual = self.state
+            else:
+                actual = self.labels.get(label_by_attr.get(attr, attr), "")
+            if actual != value:
+                return False
+        return True
+
+
+class AlertTimeline(object):
+    """Intervals of alert states within time window ordered by start."""
+
+    def __init__(self, intervals, start, end):
+        self.intervals = sorted(intervals, key=lambda item: item.start)
+        self.start = start
+        self.end = end
+
+    def __iter__(self):
+        return iter(self.intervals)
+
+    def __len__(self):
+        return len(self.intervals)
+
+    @classmethod
+    def from_series(cls, result, start, end, step):
+        """Build timeline from range query result of ALERTS.
+
+        Samples of the same alert more than a step apart are treated as
+        different intervals.
+
+        :param result: list of series.RangeSeries
+        """
+        points_by_alert = collections.defaultdict(list)
+        active_at_by_alert = collections.defaultdict(list)
+        labels_by_alert = {}
+        for item in result:
+            labels = {k: v for k, v in item.labels.items()
+                      if k not in ("__name__", "alertstate")}
+            key = tuple(sorted(labels.items()))
+            labels_by_alert[key] = labels
+            if item.labels.get("__name__") == "ALERTS_FOR_STATE":
+                active_at_by_alert[key].extend(
+                    zip(item.timestamps, item.values))
+                continue
+            state = item.labels.get("alertstate")
+            points_by_alert[key].extend(
+                (ts, state) for ts in item.timestamps)
+
+        intervals = []
+        max_gap = step * 1.5
+        for key, points in points_by_alert.items():
+            points.sort()
+            active_at = dict(active_at_by_alert.get(key, ()))
+            labels = labels_by_alert[key]
+            current = None
+            for ts, state in points:
+                if current is not None and ts - current.end <= max_gap:
+                    if state == current.state:
+                        current.end = ts
+                        continue
+                    intervals.append(current)
+                elif current is not None:
+                    current.resolved = True
+                    intervals.append(current)
+                current = AlertInterval(labels, state, ts, ts,
+                                        active_at=active_at.get(ts))
+            if current is not None:
+                current.resolved = current.end + step <= end
+                intervals.append(current)
+        return cls(intervals, start, end)
+
+    def find(self, **criteria):
+        """Return intervals matching criteria, "state" is also accepted."""
+        return [interval for interval in self.intervals
+                if interval.is_appropriate(**criteria)]
+
+    def get_firing_count(self, **criteria):
+        """Count how many times alerts matching criteria started firing."""
+        return len(self.find(state="firing", **criteria))
+
+    def get_firing_duration(self, **criteria):
+        """Return total time in seconds alerts matching criteria fired."""
+        return sum(interval.duration
+                   for interval in self.find(state="firing", **criteria))
+
+
 def get_alert_from_alert_manager_dict(json_repr):
     return AlertManagerAlert(
         name=json_repr["labels"]["alertname"],
@@ -172,6 +630,8 @@ def get_alert_from_alert_manager_dict(json_repr):
         service=json_repr["labels"]["service"],
         severity=json_repr["labels"]["severity"],
         annotations=json_repr["annotations"],
+        fingerprint=json_repr.get("fingerprint"),
+        state=json_repr.get("status", {}).get("state"),
     )
 
 
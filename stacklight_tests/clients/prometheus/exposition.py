@@ -0,0 +1,170 @@
+"""Streaming parser of Prometheus text exposition format (version 0.0.4).
+
+All functions are generators, so pages of any size are parsed with
+constant memory.
+"""
+import codecs
+import re
+
+
+_label_regex = re.compile(
+    r'\s*(?P<name>[a-zA-Z_][a-zA-Z0-9_]*)\s*=\s*'
+    r'"(?P<value>(?:[^"\\]|\\.)*)"\s*,?\s*')
+_simple_labels_regex = re.compile(
+    r'([a-zA-Z_][a-zA-Z0-9_]*)\s*=\s*"([^"\\]*)"')
+_simple_label_set_regex = re.compile(
+    r'(?:\s*[a-zA-Z_][a-zA-Z0-9_]*\s*=\s*"[^"\\]*"\s*,?)*\s*\Z')
+_label_escapes_regex = re.compile(r'\\(.)')
+_label_escapes = {"n": "\n", "\\": "\\", '"': '"'}
+_family_suffixes = {
+    "histogram": ("_bucket", "_sum", "_count"),
+    "summary": ("_sum", "_count"),
+}
+
+
+class ExpositionSample(object):
+    __slots__ = ("name", "labels", "value", "timestamp")
+
+    def __init__(self, name, labels, value, timestamp=None):
+        self.name = name
+        self.labels = labels
+        self.value = value
+        self.timestamp = timestamp
+
+    def __repr__(self):
+        return "{}: {}{} {}".format(
+            self.__class__.__name__, self.name, self.labels, self.value)
+
+
+class MetricFamily(object):
+    __slots__ = ("name", "type", "help", "samples")
+
+    def __init__(self, name, metric_type="untyped", help_text=None):
+        self.name = name
+        self.type = metric_type
+        self.help = help_text
+        self.samples = []
+
+    def __repr__(self):
+        return "{}: {} ({}, {} samples)".format(
+            self.__class__.__name__, self.name, self.type, len(self.samples))
+
+    def is_member(self, sample_name):
+        if sample_name == self.name:
+            return True
+        suffix = sample_name[len(self.name):]
+        return (sample_name.startswith(self.name) and
+                suffix in _family_suffixes.get(self.type, ()))
+
+
+def _unescape(value):
+    if "\\" not in value:
+        return value
+    return _label_escapes_regex.sub(
+        lambda m: _label_escapes.get(m.group(1), "\\" + m.group(1)), value)
+
+
+def iter_lines(chunks, encoding="utf-8"):
+    """Split stream of raw body chunks to text lines."""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pending = u""
+    for chunk in chunks:
+        lines = (pending + decoder.decode(chunk)).split(u"\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line
+    pending += decoder.decode(b"", True)
+    if pending:
+        yield pending
+
+
+def parse_sample_line(line):
+    """Parse one sample line.
+
+    :returns: tuple of (name, labels or None, value, timestamp or None),
+     value and timestamp are returned as strings
+    :raises: ValueError if the line is malformed
+    """
+    brace = line.find("{")
+    if brace == -1:
+        parts = line.split()
+        if len(parts) == 2:
+            return parts[0], None, parts[1], None
+        if len(parts) == 3:
+            return parts[0], None, parts[1], parts[2]
+        raise ValueError("Malformed sample line: {!r}".format(line))
+
+    name = line[:brace].strip()
+    end = line.rfind("}")
+    if end == -1:
+        raise ValueError("Malformed labels in line: {!r}".format(line))
+    if "\\" not in line:
+        # Fast path: no escaped quotes, so values can't contain quotes
+        if _simple_label_set_regex.match(line, brace + 1, end) is None:
+            raise ValueError("Malformed labels in line: {!r}".format(line))
+        labels = dict(_simple_labels_regex.findall(line, brace + 1, end))
+    else:
+        labels = {}
+        pos = brace + 1
+        match = _label_regex.match
+        while pos < end:
+            m = match(line, pos, end)
+            if m is None:
+                raise ValueError(
+                    "Malformed labels in line: {!r}".format(line))
+            labels[m.group("name")] = _unescape(m.group("value"))
+            pos = m.end()
+    parts = line[end + 1:].split()
+    if len(parts) == 1:
+        return name, labels, parts[0], None
+    if len(parts) == 2:
+        return name, labels, parts[0], parts[1]
+    raise ValueError("Malformed sample line: {!r}".format(line))
+
+
+def iter_samples(lines):
+    """Yield ExpositionSample for every sample line, metadata is skipped."""
+    for line in lines:
+        if not line or line[0] == "#" or line.isspace():
+            continue
+        name, labels, value, timestamp = parse_sample_line(line)
+        yield ExpositionSample(
+            name, labels or {}, float(value),
+            int(timestamp) if timestamp is not None else None)
+
+
+def iter_families(lines):
+    """Yield MetricFamily objects with samples grouped by family.
+
+    Samples of histograms and summaries (_bucket, _sum and _count series)
+    are grouped into one family according to TYPE metadata. Samples
+    without metadata form "untyped" families.
+    """
+    family = None
+    for line in lines:
+        if not line or line.isspace():
+            continue
+        if line[0] == "#":
+            parts = line[1:].split(None, 2)
+            if len(parts) < 2 or parts[0] not in ("HELP", "TYPE"):
+                continue
+            if family is None or family.name != parts[1]:
+                if family is not None:
+                    yield family
+                family = MetricFamily(parts[1])
+            text = parts[2].strip() if len(parts) > 2 else ""
+            if parts[0] == "TYPE":
+                family.type = text
+            else:
+                family.help = _unescape(text)
+            continue
+        name, labels, value, timestamp = parse_sample_line(line)
+        if family is None or not family.is_member(name):
+            if family is not None:
+                yield family
+            family = MetricFamily(name)
+        family.samples.append(ExpositionSample(
+            name, labels or {}, float(value),
+            int(timestamp) if timestamp is not None else None))
+    if family is not None:
+        yield family
@@ -1,15 +1,42 @@
+import codecs
+import collections
 import json
 import logging
 import re
 
 from stacklight_tests import utils
 from stacklight_tests.clients import http_client
+from stacklight_tests.clients.prometheus import query_cache
+from stacklight_tests.clients.prometheus import series
 
 logger = logging.getLogger(__name__)
 
+QueryResult = collections.namedtuple("QueryResult",
+                                     ["query", "result", "error"])
+
 
 class PrometheusClient(http_client.HttpClient):
     measurements = None
+    _measurements_index = None
+
+    def __init__(self, base_url=None, verify=False, user=None, password=None,
+                 cache_ttl=None, cache_size=1024):
+        """Prometheus API client.
+
+        :param cache_ttl: if set, results of instant queries and label values
+         lookups are cached for up to cache_ttl seconds
+        :param cache_size: maximum count of cached results
+        """
+        super(PrometheusClient, self).__init__(
+            base_url, verify=verify, user=user, password=password)
+        self.cache = None
+        if cache_ttl:
+            self.cache = query_cache.QueryCache(cache_ttl, cache_size)
+
+    def _cached(self, key, func):
+        if self.cache is None:
+            return func()
+        return self.cache.get_or_call(key, func)
 
     def get_updated_prometheus_query(self, query):
         updates = {'${__range_s}': '3600',
@@ -19,9 +46,16 @@ class PrometheusClient(http_client.HttpClient):
             query = query.replace(k, v)
         return query
 
-    def get_query(self, query, timestamp=None):
+    def get_query(self, query, timestamp=None, cached=True):
+        query = self.get_updated_prometheus_query(query)
+        if not cached:
+            return self._get_query(query, timestamp)
+        key = ("query", query_cache.normalize_query(query), timestamp)
+        return self._cached(key, lambda: self._get_query(query, timestamp))
+
+    def _get_query(self, query, timestamp=None):
         params = {
-            "query": self.get_updated_prometheus_query(query)
+            "query": query
         }
 
         if timestamp is not None:
@@ -35,16 +69,92 @@ class PrometheusClient(http_client.HttpClient):
 
         return query_result["data"]["result"]
 
+    def iter_query(self, query, timestamp=None, chunk_size=64 * 1024):
+        """Yield series of instant query result one by one.
+
+        Response is decoded incrementally while it is downloaded, so memory
+        usage does not depend on the size of the whole result.
+        """
+        params = {
+            "query": self.get_updated_prometheus_query(query)
+        }
+
+        if timestamp is not None:
+            params.update({"time": timestamp})
+
+        chunks = self.stream("/api/v1/query", params=params,
+                             chunk_size=chunk_size)
+        return iter_query_result(chunks)
+
+    def get_samples(self, query, timestamp=None):
+        """Run instant query and return result as list of series.Sample."""
+        return list(self.iter_samples(query, timestamp=timestamp))
+
+    def iter_samples(self, query, timestamp=None):
+        """Yield instant query result as series.Sample objects.
+
+        Result is streamed as in iter_query, label sets are interned and
+        values are parsed to floats.
+        """
+        for item in self.iter_query(query, timestamp=timestamp):
+            yield series.Sample.from_json(item)
+
+    def get_queries(self, queries, timestamp=None, max_workers=None,
+                    cached=True):
+        """Run many instant queries concurrently.
+
+        :param queries: list of queries
+        :param timestamp: evaluation timestamp for all queries
+        :param max_workers: maximum count of simultaneous requests
+        :param cached: allow to take results from the cache
+        :returns: list of QueryResult in the same order as queries,
+         error is an exception raised by the query or None
+        """
+        queries = list(queries)
+        results = utils.map_concurrently(
+            lambda q: self.get_query(q, timestamp=timestamp, cached=cached),
+            queries, max_workers=max_workers)
+        return [QueryResult(query, result, error)
+                for query, (result, error) in zip(queries, results)]
+
+    def get_presence_matrix(self, metric_names, label="host"):
+        """Find which metrics exist for which label values in one query.
+
+        :param metric_names: names of metrics to look for
+        :param label: label to group metrics by
+        :returns: PresenceMatrix
+        """
+        matrix = PresenceMatrix(metric_names, label)
+        query = 'count by ({}, __name__)({{__name__=~"{}"}})'.format(
+            label, "|".join(matrix.metric_names))
+        for item in self.get_query(query):
+            matrix.add(item["metric"].get(label, ""),
+                       item["metric"]["__name__"])
+        return matrix
+
     def get_query_range(self, query, start_time, end_time, step):
+        """Run range query.
+
+        :param start_time: unix timestamp or RFC 3339 string
+        :param end_time: unix timestamp or RFC 3339 string
+        :param step: resolution as seconds count or duration string
+        :returns: list of series.RangeSeries
+        """
         params = {
-            "query": query,
+            "query": self.get_updated_prometheus_query(query),
             "start": start_time,
             "end": end_time,
             "step": step,
         }
 
-        # TODO: Add proper return
-        return self.get("/api/v1/query_range", params=params)
+        _, resp = self.get("/api/v1/query_range", params=params)
+
+        query_result = json.loads(resp)
+        if query_result["status"] != "success":
+            raise Exception("Failed resp: {}".format(resp))
+
+        return [series.RangeSeries.from_json(item)
+                for item in query_result["data"]["result"]]
 
     def get_series(self, match):
         if issubclass(list, match):
@@ -58,6 +168,10 @@ class PrometheusClient(http_client.HttpClient):
         return self.get("/api/v1/series", params=params)
 
     def get_label_values(self, label_name):
+        return self._cached(("label_values", label_name),
+                            lambda: self._get_label_values(label_name))
+
+    def _get_label_values(self, label_name):
         _, resp = self.get("/api/v1/label/{}/values".format(label_name))
         query_result = json.loads(resp)
         if query_result["status"] != "success":
@@ -141,32 +255,234 @@ class PrometheusClient(http_client.HttpClient):
             self.measurements.discard("ALERTS")
         return self.measurements
 
+    def get_measurements_index(self):
+        if self._measurements_index is None:
+            self._measurements_index = MeasurementsIndex(
+                self.get_all_measurements())
+        return self._measurements_index
+
+    def parse_measurements(self, query):
+        """Return all known metric names referenced by query."""
+        return self.get_measurements_index().find_all(query)
+
     def parse_measurement(self, query):
-        for measurement in self.get_all_measurements():
-            if measurement in query:
-                return measurement
+        measurements = self.parse_measurements(query)
+        if measurements:
+            return measurements[0]
+
+    def get_metric_values_watcher(self, interval=30, timeout=5 * 60):
+        return MetricValuesWatcher(self, interval=interval, timeout=timeout)
 
     def check_metric_values(self, query, value, msg=None):
-        def _verify_notifications(q, v):
-            output = self.get_query(q)
+        msg = msg if msg else 'Incorrect value in metric {}'.format(query)
+        watcher = self.get_metric_values_watcher()
+        watcher.add(query, value)
+        watcher.wait(timeout_msg=msg)
+
+
+_status_regex = re.compile(r'"status"\s*:\s*"(?P<status>\w+)"')
+_result_regex = re.compile(r'"result"\s*:\s*\[')
+_whitespace_regex = re.compile(r'[\s,]*')
+_number_tail_regex = re.compile(r'[0-9.eE+-]*')
+
+
+def _raise_for_error_response(body):
+    try:
+        response = json.loads(body)
+    except ValueError:
+        return
+    if isinstance(response, dict) and response.get("status") != "success":
+        raise Exception("Failed resp: {}: {}".format(
+            response.get("errorType"), response.get("error")))
+
+
+def iter_query_result(chunks):
+    """Incrementally decode items of "data.result" of a query response.
+
+    :param chunks: iterable of raw response body chunks
+    :returns: generator of decoded result items
+    """
+    chunks = iter(chunks)
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buf = u""
+    pos = 0
+
+    def read_more():
+        for chunk in chunks:
+            text = text_decoder.decode(chunk)
+            if text:
+                return text
+        raise ValueError("Unexpected end of query response: {}".format(
+            buf[:1024]))
+
+    # Find the beginning of the result list
+    while True:
+        m = _result_regex.search(buf)
+        if m is not None:
+            break
+        try:
+            buf += read_more()
+        except ValueError:
+            # Error responses have no result, report the error of Prometheus
+            _raise_for_error_response(buf)
+            raise
+    status = _status_regex.search(buf, 0, m.start())
+    if status is None or status.group("status") != "success":
+        raise Exception("Failed resp: {}".format(buf[:1024]))
+    pos = m.end()
+
+    while True:
+        pos = _whitespace_regex.match(buf, pos).end()
+        if pos == len(buf):
+            buf = read_more()
+            pos = 0
+            continue
+        if buf[pos] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+        except ValueError:
+            # Item is not downloaded completely yet
+            buf = buf[pos:] + read_more()
+            pos = 0
+            continue
+        if (isinstance(item, (int, long, float)) and
+                _number_tail_regex.match(buf, end).end() == len(buf)):
+            # Number of scalar result may continue in the next chunk
+            buf = buf[pos:] + read_more()
+            pos = 0
+            continue
+        pos = end
+        yield item
+
+
+class MetricValuesWatcher(utils.ConditionsWatcher):
+    """Wait until many queries return expected values.
+
+    On every tick all pending queries are sent as one concurrent batch.
+    """
+    def __init__(self, client, interval=30, timeout=5 * 60):
+        super(MetricValuesWatcher, self).__init__(interval, timeout)
+        self.client = client
+
+    def add(self, query, value, msg=None):
+        msg = msg if msg else 'Incorrect value in metric {}'.format(query)
+        self.add_condition((query, str(value)), msg)
+
+    def _get_satisfied(self, pending):
+        keys = pending.keys()
+        results = self.client.get_queries([q for q, _ in keys],
+                                          cached=False)
+        satisfied = []
+        for (query, value), (_, output, error) in zip(keys, results):
             logger.info("Check '{}' value in {} metric values".format(
-                v, output))
-            if not output:
+                value, output))
+            if error is not None:
+                logger.error('Query "{}" failed: {}'.format(query, error))
+            elif not output:
                 logger.error('Empty results received, '
-                             'check a query "{0}"'.format(q))
-                return False
-            return v in output[0]["value"]
-        msg = msg if msg else 'Incorrect value in metric {}'.format(query)
-        utils.wait(
-            lambda: _verify_notifications(query, str(value)),
-            interval=30, timeout=5 * 60, timeout_msg=msg
-        )
+                             'check a query "{0}"'.format(query))
+            elif value in output[0]["value"]:
+                satisfied.append((query, value))
+        return satisfied
+
+    def _format_pending(self, pending):
+        return "\n".join(pending.values())
+
+
+class MeasurementsIndex(object):
+    """Hash index of metric names for lookups of names used in queries.
+
+    Query is split into identifier tokens by one regex pass, so names are
+    found in time linear in the query length regardless of the count of
+    known metrics. Only whole names outside of string literals are
+    matched, so a name is never confused with a longer name which starts
+    with it or with a label value.
+    """
+    # String literals are matched as a whole to skip label values, the
+    # group is empty for them
+    token_regex = re.compile(r'"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'|'
+                             r'([a-zA-Z_:][a-zA-Z0-9_:]*)')
+
+    def __init__(self, names):
+        self.names = frozenset(names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def find_all(self, query):
+        """Return names referenced by query in order of appearance."""
+        found = []
+        seen = set()
+        for token in self.token_regex.findall(query):
+            if token in self.names and token not in seen:
+                seen.add(token)
+                found.append(token)
+        return found
+
+
+class PresenceMatrix(object):
+    """Boolean matrix of label values (rows) by metric names (columns)."""
+
+    def __init__(self, metric_names, label):
+        self.label = label
+        self.metric_names = list(collections.OrderedDict.fromkeys(
+            metric_names))
+        self._columns = {name: n for n, name in enumerate(self.metric_names)}
+        self._rows = {}
+
+    def __repr__(self):
+        return "{}: {} x {}".format(
+            self.__class__.__name__, self.label, len(self.metric_names))
+
+    @property
+    def label_values(self):
+        return sorted(self._rows)
+
+    def add(self, label_value, metric_name):
+        column = self._columns.get(metric_name)
+        if column is None:
+            return
+        row = self._rows.get(label_value)
+        if row is None:
+            row = self._rows[label_value] = bytearray(len(self.metric_names))
+        row[column] = 1
+
+    def is_present(self, label_value, metric_name):
+        row = self._rows.get(label_value)
+        if row is None:
+            return False
+        return bool(row[self._columns[metric_name]])
+
+    def get_missing(self, label_values=None):
+        """Return (label value, metric name) pairs with no series.
+
+        :param label_values: expected label values, defaults to all values
+         which have at least one metric
+        """
+        if label_values is None:
+            label_values = self.label_values
+        missing = []
+        for label_value in label_values:
+            row = self._rows.get(label_value)
+            for n, name in enumerate(self.metric_names):
+                if row is None or not row[n]:
+                    missing.append((label_value, name))
+        return missing
+
+    def get_missing_metrics(self):
+        """Return names of metrics which have no series at all."""
+        return [name for n, name in enumerate(self.metric_names)
+                if not any(row[n] for row in self._rows.values())]
 
 
 def get_prometheus_client_from_config(config):
     api_client = PrometheusClient(
         "http://{0}:{1}/".format(
             config["prometheus_vip"],
-            config["prometheus_server_port"])
+            config["prometheus_server_port"]),
+        cache_ttl=config.get("query_cache_ttl"),
+        cache_size=config.get("query_cache_size", 1024),
     )
     return api_client
@@ -1,34 +1,22 @@
-import re
-
 from stacklight_tests.clients import http_client
+from stacklight_tests.clients.prometheus import exposition
 
 
 class PrometheusMetricClient(http_client.HttpClient):
-    metric_line_regex = (r'(?P<metric_name>[\w\d_]+)'
-                         r'({(?P<metric_meta>.*)})* '
-                         r'(?P<metric_value>.*)')
-
-    metric_meta_regex = r'(?P<meta_name>\w*)="(?P<meta_value>[\w\d\_\-]*)"'
-
-    def parse_raw(self, lines):
+    @staticmethod
+    def parse_raw(lines):
         metrics = []
 
         for line in lines:
-            if line[0] == "#":
+            if not line or line[0] == "#" or line.isspace():
                 continue
 
-            result = re.match(self.metric_line_regex, line)
-            metric = {
-                "name": result.group("metric_name"),
-                "value": result.group("metric_value"),
-                "meta": None,
-            }
-
-            meta = result.group("metric_meta")
-            if meta is not None:
-                metric["meta"] = dict(re.findall(self.metric_meta_regex, meta))
-
-            metrics.append(metric)
+            name, labels, value, _ = exposition.parse_sample_line(line)
+            metrics.append({
+                "name": name,
+                "value": value,
+                "meta": labels,
+            })
 
         return metrics
 
@@ -36,3 +24,13 @@ class PrometheusMetricClient(http_client.HttpClient):
         _, resp = self.get("/metrics")
 
         return self.parse_raw(resp.splitlines())
+
+    def iter_metrics(self):
+        """Yield exposition.ExpositionSample while page is downloaded."""
+        chunks = self.stream("/metrics")
+        return exposition.iter_samples(exposition.iter_lines(chunks))
+
+    def iter_metric_families(self):
+        """Yield exposition.MetricFamily while page is downloaded."""
+        chunks = self.stream("/metrics")
+        return exposition.iter_families(exposition.iter_lines(chunks))
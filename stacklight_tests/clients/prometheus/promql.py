@@ -0,0 +1,1117 @@
+"""Offline evaluator of the PromQL subset used in alert rules.
+
+Supported are number and string literals, instant and range vector
+selectors with offsets, arithmetic, comparison and set binary operators
+with bool, on/ignoring and group_left/group_right modifiers, aggregations
+with by/without and functions listed in Evaluator.functions.
+
+Expressions are evaluated against snapshots of series, which are captured
+as raw samples (see capture_snapshot) or built from synthetic data,
+so firing logic of rules can be verified without a live cloud.
+"""
+import bisect
+import collections
+import math
+import re
+
+from stacklight_tests.clients.prometheus import series
+
+
+class PromQLError(Exception):
+    pass
+
+
+# Tokenizer
+
+_token_regex = re.compile(r"""
+    (?P<space>\s+|\#[^\n]*)
+    |(?P<duration>(?:\d+(?:ms|[smhdwy]))+)(?![\w.])
+    |(?P<number>0[xX][0-9a-fA-F]+|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+    |(?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'|`[^`]*`)
+    |(?P<ident>[a-zA-Z_:][a-zA-Z0-9_:]*)
+    |(?P<op>==|!=|<=|>=|=~|!~|[-+*/%^<>=,(){}\[\]])
+""", re.VERBOSE)
+_duration_regex = re.compile(r"(\d+)(ms|[smhdwy])")
+_duration_units = {"ms": 0.001, "s": 1, "m": 60, "h": 60 * 60,
+                   "d": 24 * 60 * 60, "w": 7 * 24 * 60 * 60,
+                   "y": 365 * 24 * 60 * 60}
+_string_escapes_regex = re.compile(r"\\(.)")
+_string_escapes = {"n": "\n", "t": "\t", "r": "\r", "\\": "\\",
+                   '"': '"', "'": "'"}
+
+Token = collections.namedtuple("Token", ["type", "value", "pos"])
+
+
+def parse_duration(text):
+    """Convert duration like "1h30m" to seconds."""
+    return sum(int(count) * _duration_units[unit]
+               for count, unit in _duration_regex.findall(text))
+
+
+def _unquote(text):
+    if text[0] == "`":
+        return text[1:-1]
+    return _string_escapes_regex.sub(
+        lambda m: _string_escapes.get(m.group(1), "\\" + m.group(1)),
+        text[1:-1])
+
+
+def tokenize(query):
+    """Split query into list of tokens, whitespace and comments skipped."""
+    tokens = []
+    pos = 0
+    while pos < len(query):
+        m = _token_regex.match(query, pos)
+        if m is None:
+            raise PromQLError("Unexpected character {!r} at {} in {}".format(
+                query[pos], pos, query))
+        if m.lastgroup != "space":
+            tokens.append(Token(m.lastgroup, m.group(), pos))
+        pos = m.end()
+    return tokens
+
+
+# Abstract syntax tree
+
+NumberLiteral = collections.namedtuple("NumberLiteral", ["value"])
+StringLiteral = collections.namedtuple("StringLiteral", ["value"])
+VectorSelector = collections.namedtuple(
+    "VectorSelector", ["name", "matchers", "offset"])
+MatrixSelector = collections.namedtuple(
+    "MatrixSelector", ["vector", "range"])
+Call = collections.namedtuple("Call", ["func", "args"])
+Aggregate = collections.namedtuple(
+    "Aggregate", ["op", "expr", "param", "grouping", "without"])
+Unary = collections.namedtuple("Unary", ["op", "expr"])
+Binary = collections.namedtuple(
+    "Binary", ["op", "lhs", "rhs", "return_bool", "matching", "on",
+               "group_side", "include"])
+Matcher = collections.namedtuple("Matcher", ["name", "op", "value"])
+
+
+def format_selector(selector):
+    """Render VectorSelector back to PromQL without offset."""
+    matchers = ",".join(
+        '{}{}"{}"'.format(
+            m.name, m.op, m.value.replace("\\", "\\\\").replace(
+                '"', '\\"'))
+        for m in selector.matchers
+        if not (m.name == "__name__" and m.value == selector.name))
+    return "{}{{{}}}".format(selector.name or "", matchers)
+
+
+def iter_nodes(node):
+    """Yield all nodes of the tree in depth-first order."""
+    yield node
+    if isinstance(node, MatrixSelector):
+        for child in iter_nodes(node.vector):
+            yield child
+    elif isinstance(node, Call):
+        for arg in node.args:
+            for child in iter_nodes(arg):
+                yield child
+    elif isinstance(node, Aggregate):
+        if node.param is not None:
+            for child in iter_nodes(node.param):
+                yield child
+        for child in iter_nodes(node.expr):
+            yield child
+    elif isinstance(node, Unary):
+        for child in iter_nodes(node.expr):
+            yield child
+    elif isinstance(node, Binary):
+        for side in (node.lhs, node.rhs):
+            for child in iter_nodes(side):
+                yield child
+
+
+def get_metric_names(node):
+    """Return set of metric names used by selectors of the tree."""
+    names = set()
+    for child in iter_nodes(node):
+        if isinstance(child, VectorSelector):
+            if child.name is not None:
+                names.add(child.name)
+            else:
+                names.update(m.value for m in child.matchers
+                             if m.name == "__name__" and m.op == "=")
+    return names
+
+
+# Parser
+
+AGGREGATIONS = frozenset(["sum", "avg", "min", "max", "count", "stddev",
+                          "stdvar", "group", "topk", "bottomk", "quantile",
+                          "count_values"])
+_aggregations_with_param = frozenset(["topk", "bottomk", "quantile",
+                                      "count_values"])
+_binary_precedence = {
+    "or": 1,
+    "and": 2, "unless": 2,
+    "==": 3, "!=": 3, "<": 3, ">": 3, "<=": 3, ">=": 3,
+    "+": 4, "-": 4,
+    "*": 5, "/": 5, "%": 5,
+    "^": 6,
+}
+_set_operators = frozenset(["and", "or", "unless"])
+_comparison_operators = frozenset(["==", "!=", "<", ">", "<=", ">="])
+
+
+class Parser(object):
+    def __init__(self, query):
+        self.query = query
+        self.tokens = tokenize(query)
+        self.pos = 0
+
+    def _peek(self, offset=0):
+        pos = self.pos + offset
+        if pos < len(self.tokens):
+            return self.tokens[pos]
+        return Token("eof", "", len(self.query))
+
+    def _next(self):
+        token = self._peek()
+        self.pos += 1
+        return token
+
+    def _error(self, message, token=None):
+        token = token or self._peek()
+        return PromQLError("{} at {} in {!r}".format(
+            message, token.pos, self.query))
+
+    def _expect(self, value, token_type=None):
+        token = self._next()
+        if token.value != value or (token_type and token.type != token_type):
+            raise self._error("Expected {!r}, got {!r}".format(
+                value, token.value), token)
+        return token
+
+    def _is_keyword(self, *keywords):
+        # Keywords are case-insensitive unlike names of metrics and labels
+        token = self._peek()
+        return token.type == "ident" and token.value.lower() in keywords
+
+    def _accept(self, value):
+        token = self._peek()
+        if ((token.type == "op" and token.value == value) or
+                self._is_keyword(value)):
+            return self._next()
+        return None
+
+    def parse(self):
+        expr = self._parse_expr(1)
+        if self._peek().type != "eof":
+            raise self._error("Unexpected token {!r}".format(
+                self._peek().value))
+        return expr
+
+    def _binary_operator(self):
+        token = self._peek()
+        if token.type == "op" and token.value in _binary_precedence:
+            return token.value
+        if self._is_keyword(*_set_operators):
+            return token.value.lower()
+        return None
+
+    def _parse_expr(self, min_precedence):
+        lhs = self._parse_unary()
+        while True:
+            op = self._binary_operator()
+            if op is None or _binary_precedence[op] < min_precedence:
+                return lhs
+            self._next()
+            return_bool = bool(self._accept("bool"))
+            if return_bool and op not in _comparison_operators:
+                raise self._error("bool modifier on non-comparison operator")
+            matching = None
+            on = ()
+            group_side = None
+            include = ()
+            for keyword in ("on", "ignoring"):
+                if self._accept(keyword):
+                    matching = keyword
+                    on = self._parse_labels()
+                    break
+            for keyword in ("group_left", "group_right"):
+                if self._accept(keyword):
+                    group_side = keyword
+                    if self._peek().value == "(":
+                        include = self._parse_labels()
+                    break
+            precedence = _binary_precedence[op]
+            # Power is right associative, other operators are left ones
+            next_precedence = precedence if op == "^" else precedence + 1
+            rhs = self._parse_expr(next_precedence)
+            lhs = Binary(op, lhs, rhs, return_bool, matching, on,
+                         group_side, include)
+
+    def _parse_unary(self):
+        token = self._peek()
+        if token.type == "op" and token.value in ("-", "+"):
+            self._next()
+            expr = self._parse_expr(_binary_precedence["^"])
+            if token.value == "+":
+                return expr
+            if isinstance(expr, NumberLiteral):
+                return NumberLiteral(-expr.value)
+            return Unary("-", expr)
+        return self._parse_postfix(self._parse_primary())
+
+    def _parse_postfix(self, expr):
+        while True:
+            if self._peek().value == "[" and self._peek().type == "op":
+                if not isinstance(expr, VectorSelector):
+                    raise self._error("Range of non-selector expression")
+                self._next()
+                duration = self._next()
+                if duration.type != "duration":
+                    raise self._error("Expected duration", duration)
+                self._expect("]")
+                expr = MatrixSelector(expr, parse_duration(duration.value))
+            elif self._is_keyword("offset"):
+                self._next()
+                sign = -1 if self._accept("-") else 1
+                duration = self._next()
+                if duration.type != "duration":
+                    raise self._error("Expected duration", duration)
+                offset = sign * parse_duration(duration.value)
+                if isinstance(expr, VectorSelector):
+                    expr = expr._replace(offset=offset)
+                elif isinstance(expr, MatrixSelector):
+                    expr = expr._replace(
+                        vector=expr.vector._replace(offset=offset))
+                else:
+                    raise self._error("Offset of non-selector expression")
+            else:
+                return expr
+
+    def _parse_primary(self):
+        token = self._next()
+        if token.type == "number":
+            if token.value.lower().startswith("0x"):
+                return NumberLiteral(float(int(token.value, 16)))
+            return NumberLiteral(float(token.value))
+        if token.type == "string":
+            return StringLiteral(_unquote(token.value))
+        if token.type == "op" and token.value == "(":
+            expr = self._parse_expr(1)
+            self._expect(")")
+            return expr
+        if token.type == "op" and token.value == "{":
+            self.pos -= 1
+            return VectorSelector(None, self._parse_matchers(), 0)
+        if token.type == "ident":
+            following = self._peek()
+            if token.value.lower() in ("inf", "nan"):
+                return NumberLiteral(float(token.value))
+            if token.value.lower() in AGGREGATIONS and (
+                    following.value.lower() in ("(", "by", "without")):
+                return self._parse_aggregation(token.value.lower())
+            if following.type == "op" and following.value == "(":
+                return self._parse_call(token.value)
+            matchers = [Matcher("__name__", "=", token.value)]
+            if following.type == "op" and following.value == "{":
+                matchers.extend(self._parse_matchers())
+            return VectorSelector(token.value, matchers, 0)
+        raise self._error("Unexpected token {!r}".format(token.value), token)
+
+    def _parse_labels(self):
+        self._expect("(")
+        labels = []
+        while self._peek().value != ")":
+            token = self._next()
+            if token.type != "ident":
+                raise self._error("Expected label name", token)
+            labels.append(token.value)
+            if not self._accept(","):
+                break
+        self._expect(")")
+        return tuple(labels)
+
+    def _parse_matchers(self):
+        self._expect("{")
+        matchers = []
+        while self._peek().value != "}":
+            name = self._next()
+            if name.type != "ident":
+                raise self._error("Expected label name", name)
+            op = self._next()
+            if op.value not in ("=", "!=", "=~", "!~"):
+                raise self._error("Expected label matcher operator", op)
+            value = self._next()
+            if value.type != "string":
+                raise self._error("Expected label value", value)
+            matchers.append(Matcher(name.value, op.value,
+                                    _unquote(value.value)))
+            if not self._accept(","):
+                break
+        self._expect("}")
+        return matchers
+
+    def _parse_call(self, func):
+        self._expect("(")
+        args = []
+        while self._peek().value != ")":
+            args.append(self._parse_expr(1))
+            if not self._accept(","):
+                break
+        self._expect(")")
+        return Call(func, tuple(args))
+
+    def _parse_aggregation(self, op):
+        grouping = ()
+        without = False
+        if self._is_keyword("by", "without"):
+            without = self._next().value.lower() == "without"
+            grouping = self._parse_labels()
+        self._expect("(")
+        param = None
+        if op in _aggregations_with_param:
+            param = self._parse_expr(1)
+            self._expect(",")
+        expr = self._parse_expr(1)
+        self._expect(")")
+        if not grouping and self._is_keyword("by", "without"):
+            without = self._next().value.lower() == "without"
+            grouping = self._parse_labels()
+        return Aggregate(op, expr, param, grouping, without)
+
+
+def parse(query):
+    """Parse PromQL query into tree of nodes."""
+    return Parser(query).parse()
+
+
+# Evaluator
+
+class InstantVector(list):
+    """List of (labels dict, value) pairs."""
+
+
+class RangeVector(list):
+    """List of (labels dict, list of (timestamp, value)) pairs."""
+
+
+def _drop_name(labels):
+    if "__name__" not in labels:
+        return labels
+    labels = dict(labels)
+    del labels["__name__"]
+    return labels
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _match_regex(regex):
+    return re.compile("(?:{})$".format(regex), re.DOTALL)
+
+
+def _divide(a, b):
+    if b == 0:
+        if a == 0 or math.isnan(a):
+            return float("nan")
+        return math.copysign(float("inf"), a) * math.copysign(1, b)
+    return a / b
+
+
+def _modulo(a, b):
+    if b == 0:
+        return float("nan")
+    return math.fmod(a, b)
+
+
+def _power(a, b):
+    try:
+        return math.pow(a, b)
+    except OverflowError:
+        return float("inf")
+    except ValueError:
+        return float("nan")
+
+
+_arithmetic = {
+    "+": lambda a, b: a + b,
+    "-": lambda a, b: a - b,
+    "*": lambda a, b: a * b,
+    "/": _divide,
+    "%": _modulo,
+    "^": _power,
+}
+_comparisons = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    ">": lambda a, b: a > b,
+    "<=": lambda a, b: a <= b,
+    ">=": lambda a, b: a >= b,
+}
+
+
+def _quantile(phi, values):
+    if not values:
+        return float("nan")
+    if phi < 0:
+        return float("-inf")
+    if phi > 1:
+        return float("inf")
+    values = sorted(values)
+    rank = phi * (len(values) - 1)
+    lower = int(math.floor(rank))
+    upper = min(lower + 1, len(values) - 1)
+    weight = rank - lower
+    return values[lower] * (1 - weight) + values[upper] * weight
+
+
+def _stdvar(values):
+    mean = sum(values) / len(values)
+    return sum((value - mean) ** 2 for value in values) / len(values)
+
+
+def _extrapolated_delta(points, start, end, is_counter, is_rate):
+    """Port of Prometheus extrapolatedRate function."""
+    if len(points) < 2:
+        return None
+    result = points[-1][1] - points[0][1]
+    if is_counter:
+        previous = points[0][1]
+        for _, value in points[1:]:
+            if value < previous:
+                result += previous
+            previous = value
+    duration_to_start = points[0][0] - start
+    duration_to_end = end - points[-1][0]
+    sampled_interval = points[-1][0] - points[0][0]
+    average_interval = sampled_interval / (len(points) - 1)
+    if is_counter and result > 0 and points[0][1] >= 0:
+        duration_to_zero = sampled_interval * (points[0][1] / result)
+        if duration_to_zero < duration_to_start:
+            duration_to_start = duration_to_zero
+    threshold = average_interval * 1.1
+    extrapolate_to = sampled_interval
+    extrapolate_to += (duration_to_start if duration_to_start < threshold
+                       else average_interval / 2)
+    extrapolate_to += (duration_to_end if duration_to_end < threshold
+                       else average_interval / 2)
+    result *= extrapolate_to / sampled_interval
+    if is_rate:
+        result /= end - start
+    return result
+
+
+def _instant_delta(points, is_rate):
+    if len(points) < 2:
+        return None
+    (previous_ts, previous), (last_ts, last) = points[-2], points[-1]
+    if is_rate:
+        result = last if last < previous else last - previous
+        return result / (last_ts - previous_ts)
+    return last - previous
+
+
+def _linear_regression(points, intercept_time):
+    count = len(points)
+    sum_x = sum_y = sum_xy = sum_x2 = 0.0
+    for ts, value in points:
+        x = ts - intercept_time
+        sum_x += x
+        sum_y += value
+        sum_xy += x * value
+        sum_x2 += x * x
+    covariance = sum_xy - sum_x * sum_y / count
+    variance = sum_x2 - sum_x * sum_x / count
+    slope = covariance / variance if variance else 0.0
+    intercept = sum_y / count - slope * sum_x / count
+    return slope, intercept
+
+
+def _histogram_quantile(phi, buckets):
+    buckets = sorted(buckets)
+    if len(buckets) < 2 or buckets[-1][0] != float("inf"):
+        return float("nan")
+    total = buckets[-1][1]
+    if total == 0:
+        return float("nan")
+    rank = phi * total
+    for n, (upper, count) in enumerate(buckets):
+        if count >= rank:
+            break
+    if upper == float("inf"):
+        return buckets[-2][0]
+    lower, lower_count = (0.0, 0.0) if n == 0 else buckets[n - 1]
+    if n == 0 and upper <= 0:
+        return upper
+    return lower + (upper - lower) * (
+        (rank - lower_count) / (count - lower_count))
+
+
+class Evaluator(object):
+    """Evaluate PromQL expressions against series snapshot.
+
+    :param snapshot: iterable of series.RangeSeries
+    :param lookback: lookback delta of instant selectors in seconds
+    """
+    def __init__(self, snapshot, lookback=5 * 60):
+        self.lookback = lookback
+        self._series_by_name = collections.defaultdict(list)
+        for item in snapshot:
+            self._series_by_name[item.labels.get("__name__")].append(item)
+        self._regex_cache = {}
+        self.functions = {
+            "abs": self._math_function(abs),
+            "ceil": self._math_function(math.ceil),
+            "floor": self._math_function(math.floor),
+            "exp": self._math_function(math.exp),
+            "sqrt": self._math_function(math.sqrt),
+            "round": self._round,
+            "clamp_max": self._clamp(min),
+            "clamp_min": self._clamp(max),
+            "absent": self._absent,
+            "time": lambda args, node, t: float(t),
+            "vector": self._vector,
+            "scalar": self._scalar,
+            "label_replace": self._label_replace,
+            "histogram_quantile": self._histogram_quantile,
+            "rate": self._range_function(
+                lambda points, start, end: _extrapolated_delta(
+                    points, start, end, True, True)),
+            "increase": self._range_function(
+                lambda points, start, end: _extrapolated_delta(
+                    points, start, end, True, False)),
+            "delta": self._range_function(
+                lambda points, start, end: _extrapolated_delta(
+                    points, start, end, False, False)),
+            "irate": self._range_function(
+                lambda points, start, end: _instant_delta(points, True)),
+            "idelta": self._range_function(
+                lambda points, start, end: _instant_delta(points, False)),
+            "deriv": self._range_function(
+                lambda points, start, end: (
+                    _linear_regression(points, end)[0]
+                    if len(points) > 1 else None)),
+            "predict_linear": self._predict_linear,
+            "avg_over_time": self._over_time(
+                lambda values: sum(values) / len(values)),
+            "min_over_time": self._over_time(min),
+            "max_over_time": self._over_time(max),
+            "sum_over_time": self._over_time(sum),
+            "count_over_time": self._over_time(lambda values: len(values)),
+            "last_over_time": self._over_time(lambda values: values[-1]),
+            "stddev_over_time": self._over_time(
+                lambda values: math.sqrt(_stdvar(values))),
+            "stdvar_over_time": self._over_time(_stdvar),
+            "quantile_over_time": self._quantile_over_time,
+        }
+
+    # Selectors
+
+    def _matches(self, labels, matchers):
+        for matcher in matchers:
+            value = labels.get(matcher.name, "")
+            if matcher.op == "=":
+                matched = value == matcher.value
+            elif matcher.op == "!=":
+                matched = value != matcher.value
+            else:
+                regex = self._regex_cache.get(matcher.value)
+                if regex is None:
+                    regex = self._regex_cache[matcher.value] = _match_regex(
+                        matcher.value)
+                matched = regex.match(value) is not None
+                if matcher.op == "!~":
+                    matched = not matched
+            if not matched:
+                return False
+        return True
+
+    def _select(self, selector):
+        if selector.name is not None:
+            candidates = self._series_by_name.get(selector.name, ())
+        else:
+            candidates = [item for items in self._series_by_name.values()
+                          for item in items]
+        return [item for item in candidates
+                if self._matches(item.labels, selector.matchers)]
+
+    def _eval_vector_selector(self, node, t):
+        t -= node.offset
+        result = InstantVector()
+        for item in self._select(node):
+            n = bisect.bisect_right(item.timestamps, t)
+            if n and item.timestamps[n - 1] > t - self.lookback:
+                result.append((item.labels, float(item.values[n - 1])))
+        return result
+
+    def _eval_matrix_selector(self, node, t):
+        t -= node.vector.offset
+        result = RangeVector()
+        for item in self._select(node.vector):
+            first = bisect.bisect_right(item.timestamps, t - node.range)
+            last = bisect.bisect_right(item.timestamps, t)
+            points = [(float(item.timestamps[n]), float(item.values[n]))
+                      for n in range(first, last)]
+            if points:
+                result.append((item.labels, points))
+        return result
+
+    # Functions
+
+    def _math_function(self, func):
+        def apply(args, node, t):
+            return InstantVector(
+                (_drop_name(labels), float(func(value)))
+                for labels, value in args[0])
+        return apply
+
+    def _round(self, args, node, t):
+        to_nearest = args[1] if len(args) > 1 else 1.0
+        return InstantVector(
+            (_drop_name(labels),
+             math.floor(value / to_nearest + 0.5) * to_nearest)
+            for labels, value in args[0])
+
+    def _clamp(self, func):
+        def apply(args, node, t):
+            return InstantVector((_drop_name(labels), func(value, args[1]))
+                                 for labels, value in args[0])
+        return apply
+
+    def _absent(self, args, node, t):
+        if args[0]:
+            return InstantVector()
+        labels = {}
+        argument = node.args[0]
+        if isinstance(argument, VectorSelector):
+            labels = {m.name: m.value for m in argument.matchers
+                      if m.op == "=" and m.name != "__name__"}
+        return InstantVector([(labels, 1.0)])
+
+    def _vector(self, args, node, t):
+        return InstantVector([({}, args[0])])
+
+    def _scalar(self, args, node, t):
+        if len(args[0]) != 1:
+            return float("nan")
+        return args[0][0][1]
+
+    def _label_replace(self, args, node, t):
+        vector, destination, replacement, source, regex = args
+        regex = _match_regex(regex)
+        result = InstantVector()
+        for labels, value in vector:
+            m = regex.match(labels.get(source, ""))
+            if m is not None:
+                new_value = re.sub(
+                    r"\$(?:(\d+)|\{(\w+)\})",
+                    lambda r: m.group(int(r.group(1)) if r.group(1)
+                                      else r.group(2)) or "",
+                    replacement)
+                labels = dict(labels)
+                if new_value:
+                    labels[destination] = new_value
+                else:
+                    labels.pop(destination, None)
+            result.append((labels, value))
+        return result
+
+    def _histogram_quantile(self, args, node, t):
+        phi, vector = args
+        groups = collections.OrderedDict()
+        for labels, value in vector:
+            if "le" not in labels:
+                continue
+            group_labels = _drop_name(labels)
+            group_labels = {k: v for k, v in group_labels.items()
+                            if k != "le"}
+            key = _labels_key(group_labels)
+            groups.setdefault(key, (group_labels, []))[1].append(
+                (float(labels["le"]), value))
+        return InstantVector(
+            (labels, _histogram_quantile(phi, buckets))
+            for labels, buckets in groups.values())
+
+    def _range_function(self, func):
+        def apply(args, node, t):
+            range_node = node.args[0]
+            if not isinstance(range_node, MatrixSelector):
+                raise PromQLError("{} expects range vector".format(node.func))
+            end = t - range_node.vector.offset
+            start = end - range_node.range
+            result = InstantVector()
+            for labels, points in args[0]:
+                value = func(points, start, end)
+                if value is not None:
+                    result.append((_drop_name(labels), value))
+            return result
+        return apply
+
+    def _predict_linear(self, args, node, t):
+        vector, seconds = args
+        result = InstantVector()
+        for labels, points in vector:
+            if len(points) < 2:
+                continue
+            slope, intercept = _linear_regression(points, t)
+            result.append((_drop_name(labels), slope * seconds + intercept))
+        return result
+
+    def _over_time(self, func):
+        def apply(args, node, t):
+            return InstantVector(
+                (_drop_name(labels), float(func([v for _, v in points])))
+                for labels, points in args[-1])
+        return apply
+
+    def _quantile_over_time(self, args, node, t):
+        phi, vector = args
+        return InstantVector(
+            (_drop_name(labels), _quantile(phi, [v for _, v in points]))
+            for labels, points in vector)
+
+    # Operators
+
+    def _eval_aggregate(self, node, t):
+        vector = self._eval(node.expr, t)
+        param = None if node.param is None else self._eval(node.param, t)
+        groups = collections.OrderedDict()
+        for labels, value in vector:
+            if node.without:
+                group_labels = {k: v for k, v in labels.items()
+                                if k not in node.grouping and
+                                k != "__name__"}
+            else:
+                group_labels = {k: labels[k] for k in node.grouping
+                                if k in labels}
+            if node.op == "count_values":
+                group_labels[param] = "{:g}".format(value)
+            key = _labels_key(group_labels)
+            groups.setdefault(key, (group_labels, []))[1].append(
+                (labels, value))
+
+        result = InstantVector()
+        for group_labels, items in groups.values():
+            values = [value for _, value in items]
+            if node.op in ("topk", "bottomk"):
+                items = sorted(items, key=lambda item: item[1],
+                               reverse=node.op == "topk")
+                result.extend(items[:int(param)])
+                continue
+            if node.op == "sum":
+                value = sum(values)
+            elif node.op == "avg":
+                value = sum(values) / len(values)
+            elif node.op == "min":
+                value = min(values)
+            elif node.op == "max":
+                value = max(values)
+            elif node.op in ("count", "count_values"):
+                value = float(len(values))
+            elif node.op == "group":
+                value = 1.0
+            elif node.op == "stddev":
+                value = math.sqrt(_stdvar(values))
+            elif node.op == "stdvar":
+                value = _stdvar(values)
+            elif node.op == "quantile":
+                value = _quantile(param, values)
+            result.append((group_labels, value))
+        return result
+
+    @staticmethod
+    def _signature(labels, node):
+        if node.matching == "on":
+            return tuple((name, labels.get(name, "")) for name in node.on)
+        ignored = node.on if node.matching == "ignoring" else ()
+        return tuple(sorted(
+            (k, v) for k, v in labels.items()
+            if k != "__name__" and k not in ignored))
+
+    def _eval_binary(self, node, t):
+        lhs = self._eval(node.lhs, t)
+        rhs = self._eval(node.rhs, t)
+        lhs_is_vector = isinstance(lhs, InstantVector)
+        rhs_is_vector = isinstance(rhs, InstantVector)
+        op = node.op
+
+        if op in _set_operators:
+            if not (lhs_is_vector and rhs_is_vector):
+                raise PromQLError("Set operator {} on scalars".format(op))
+            return self._eval_set_operator(node, lhs, rhs)
+
+        if not lhs_is_vector and not rhs_is_vector:
+            if op in _comparisons:
+                if not node.return_bool:
+                    raise PromQLError(
+                        "Comparison of scalars requires bool modifier")
+                return float(_comparisons[op](lhs, rhs))
+            return _arithmetic[op](lhs, rhs)
+
+        if lhs_is_vector and rhs_is_vector:
+            return self._eval_vector_matching(node, lhs, rhs)
+
+        result = InstantVector()
+        swapped = not lhs_is_vector
+        vector, scalar = (rhs, lhs) if swapped else (lhs, rhs)
+        for labels, value in vector:
+            a, b = (scalar, value) if swapped else (value, scalar)
+            new_value, keep = self._apply(node, a, b)
+            if not keep:
+                continue
+            if op in _comparisons and not node.return_bool:
+                # Vector element value is kept even if it's on the right
+                new_value = value
+            if op not in _comparisons or node.return_bool:
+                labels = _drop_name(labels)
+            result.append((labels, new_value))
+        return result
+
+    @staticmethod
+    def _apply(node, a, b):
+        """Return operation result and whether the element is kept."""
+        if node.op in _comparisons:
+            matched = _comparisons[node.op](a, b)
+            if node.return_bool:
+                return float(matched), True
+            return a, matched
+        return _arithmetic[node.op](a, b), True
+
+    def _eval_set_operator(self, node, lhs, rhs):
+        rhs_signatures = {self._signature(labels, node) for labels, _ in rhs}
+        if node.op == "and":
+            return InstantVector(
+                item for item in lhs
+                if self._signature(item[0], node) in rhs_signatures)
+        if node.op == "unless":
+            return InstantVector(
+                item for item in lhs
+                if self._signature(item[0], node) not in rhs_signatures)
+        lhs_signatures = {self._signature(labels, node)
+                          for labels, _ in lhs}
+        result = InstantVector(lhs)
+        result.extend(item for item in rhs
+                      if self._signature(item[0], node) not in lhs_signatures)
+        return result
+
+    def _eval_vector_matching(self, node, lhs, rhs):
+        if node.group_side == "group_right":
+            many, one = rhs, lhs
+        else:
+            many, one = lhs, rhs
+        one_by_signature = {}
+        for labels, value in one:
+            signature = self._signature(labels, node)
+            if signature in one_by_signature:
+                raise PromQLError(
+                    "Many-to-many matching is not allowed: found duplicate "
+                    "series for {} on the 'one' side".format(dict(signature)))
+            one_by_signature[signature] = (labels, value)
+
+        result = InstantVector()
+        seen = set()
+        for labels, value in many:
+            signature = self._signature(labels, node)
+            matched = one_by_signature.get(signature)
+            if matched is None:
+                continue
+            if node.group_side is None:
+                if signature in seen:
+                    raise PromQLError(
+                        "Multiple matches for labels {}, grouping is "
+                        "required".format(dict(signature)))
+                seen.add(signature)
+            one_labels, one_value = matched
+            if node.group_side == "group_right":
+                a, b = one_value, value
+            else:
+                a, b = value, one_value
+            new_value, keep = self._apply(node, a, b)
+            if not keep:
+                continue
+            if node.op not in _comparisons or node.return_bool:
+                labels = _drop_name(labels)
+            if node.matching == "on" and node.group_side is None:
+                labels = {k: v for k, v in labels.items()
+                          if k in node.on or k == "__name__"}
+            elif node.matching == "ignoring" and node.group_side is None:
+                labels = {k: v for k, v in labels.items()
+                          if k not in node.on}
+            if node.include:
+                labels = dict(labels)
+                for name in node.include:
+                    if name in one_labels:
+                        labels[name] = one_labels[name]
+                    else:
+                        labels.pop(name, None)
+            if node.group_side == "group_right" and node.op in _comparisons:
+                new_value = value if not node.return_bool else new_value
+            result.append((labels, new_value))
+        return result
+
+    # Entry points
+
+    def _eval(self, node, t):
+        if isinstance(node, NumberLiteral):
+            return node.value
+        if isinstance(node, StringLiteral):
+            return node.value
+        if isinstance(node, VectorSelector):
+            return self._eval_vector_selector(node, t)
+        if isinstance(node, MatrixSelector):
+            return self._eval_matrix_selector(node, t)
+        if isinstance(node, Unary):
+            value = self._eval(node.expr, t)
+            if isinstance(value, InstantVector):
+                return InstantVector((_drop_name(labels), -v)
+                                     for labels, v in value)
+            return -value
+        if isinstance(node, Aggregate):
+            return self._eval_aggregate(node, t)
+        if isinstance(node, Binary):
+            return self._eval_binary(node, t)
+        if isinstance(node, Call):
+            func = self.functions.get(node.func)
+            if func is None:
+                raise PromQLError("Unsupported function {}".format(
+                    node.func))
+            args = [self._eval(arg, t) for arg in node.args]
+            return func(args, node, t)
+        raise PromQLError("Unsupported node {!r}".format(node))
+
+    def evaluate(self, query, t):
+        """Evaluate query at unix time t.
+
+        :param query: PromQL string or parsed tree
+        :returns: InstantVector, float for scalars or string
+        """
+        node = parse(query) if isinstance(query, basestring) else query
+        return self._eval(node, t)
+
+    def evaluate_range(self, query, start, end, step):
+        """Evaluate query at every step from start to end.
+
+        :returns: list of series.RangeSeries
+        """
+        node = parse(query) if isinstance(query, basestring) else query
+        points = collections.OrderedDict()
+        t = start
+        while t <= end:
+            value = self._eval(node, t)
+            if not isinstance(value, InstantVector):
+                value = [({}, value)]
+            for labels, v in value:
+                key = _labels_key(labels)
+                points.setdefault(key, (labels, [], []))
+                points[key][1].append(t)
+                points[key][2].append(v)
+            t += step
+        return [series.RangeSeries(labels, timestamps, values)
+                for labels, timestamps, values in points.values()]
+
+    def evaluate_alert(self, query, start, end, step, for_duration=0):
+        """Evaluate alerting rule expression over time.
+
+        Alert becomes active when expression returns series for it and
+        fires if it is still returned "for_duration" seconds later.
+
+        :returns: list of AlertActivation in order of activation
+        """
+        node = parse(query) if isinstance(query, basestring) else query
+        active = collections.OrderedDict()
+        activations = []
+        t = start
+        while t <= end:
+            value = self._eval(node, t)
+            current = {}
+            for labels, _ in value:
+                current[_labels_key(labels)] = labels
+            for key in list(active):
+                if key not in current:
+                    activation = active.pop(key)
+                    activations.append(activation._replace(resolved_at=t))
+            for key, labels in current.items():
+                activation = active.get(key)
+                if activation is None:
+                    activation = active[key] = AlertActivation(
+                        labels, t, None, None)
+                if (activation.fired_at is None and
+                        t - activation.active_at >= for_duration):
+                    active[key] = activation._replace(fired_at=t)
+            t += step
+        activations.extend(active.values())
+        return sorted(activations, key=lambda item: item.active_at)
+
+
+AlertActivation = collections.namedtuple(
+    "AlertActivation", ["labels", "active_at", "fired_at", "resolved_at"])
+
+
+def capture_snapshot(client, query, start, end, lookback=5 * 60):
+    """Fetch series needed to evaluate query offline from start to end.
+
+    Every distinct selector of the query is fetched once with an instant
+    query of its range vector, which covers the time range extended by the
+    largest range, offset and lookback the selector is used with. Raw
+    samples are returned this way, so the evaluator applies lookback and
+    range functions to the same points as Prometheus does.
+
+    :param client: PrometheusClient
+    :returns: list of series.RangeSeries
+    """
+    node = parse(query) if isinstance(query, basestring) else query
+    nodes = list(iter_nodes(node))
+    # Vector selectors of range selectors are fetched with their ranges
+    range_vectors = {id(child.vector) for child in nodes
+                     if isinstance(child, MatrixSelector)}
+    windows = collections.OrderedDict()
+    for child in nodes:
+        if isinstance(child, MatrixSelector):
+            selector, window = child.vector, child.range
+        elif (isinstance(child, VectorSelector) and
+                id(child) not in range_vectors):
+            selector, window = child, lookback
+        else:
+            continue
+        key = format_selector(selector)
+        first = start - selector.offset - window
+        last = end - selector.offset
+        if key in windows:
+            first = min(first, windows[key][0])
+            last = max(last, windows[key][1])
+        windows[key] = (first, last)
+
+    snapshot = collections.OrderedDict()
+    for selector, (first, last) in windows.items():
+        range_query = "{}[{}s]".format(selector, int(math.ceil(last - first)))
+        for item in client.get_query(range_query, timestamp=last,
+                                     cached=False):
+            item = series.RangeSeries.from_json(item)
+            snapshot[_labels_key(item.labels)] = item
+    return list(snapshot.values())
+
+
+def snapshot_from_samples(samples, default_time=None):
+    """Build snapshot from exposition samples, e.g. of /federate output.
+
+    Scrapes of the same series taken at different times are merged into
+    one series.
+
+    :param samples: iterable of exposition.ExpositionSample
+    :param default_time: unix time of samples without timestamp
+    :returns: list of series.RangeSeries
+    """
+    points = collections.OrderedDict()
+    for sample in samples:
+        sample_labels = dict(sample.labels)
+        sample_labels["__name__"] = sample.name
+        sample_time = (default_time if sample.timestamp is None
+                       else sample.timestamp / 1000.0)
+        points.setdefault(
+            _labels_key(sample_labels), (sample_labels, []))[1].append(
+            (sample_time, sample.value))
+    snapshot = []
+    for labels, items in points.values():
+        items.sort()
+        snapshot.append(series.RangeSeries(
+            labels, [ts for ts, _ in items], [value for _, value in items]))
+    return snapshot
@@ -0,0 +1,185 @@
+import collections
+import copy
+import re
+import threading
+import time
+
+
+_normalize_regex = re.compile(
+    r'("(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'|`[^`]*`)|\s+')
+
+
+def normalize_query(query):
+    """Collapse insignificant whitespace of a query.
+
+    Whitespace inside of string literals is kept as is.
+    """
+    return _normalize_regex.sub(
+        lambda m: m.group(1) if m.group(1) is not None else " ",
+        query).strip()
+
+
+class QueryCache(object):
+    """LRU cache of query results that are valid within a time bucket.
+
+    Results are stored together with the number of the current
+    "ttl"-long time bucket, so entry is never older than ttl seconds and
+    all entries become stale together when the next bucket starts.
+
+    Results are copied when stored and when returned, so callers may
+    modify them without affecting the cache.
+    """
+    def __init__(self, ttl, max_size=1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def _current_bucket(self):
+        return int(time.time() // self.ttl)
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None or item[0] != self._current_bucket():
+                self.misses += 1
+                return None
+            # Reinsert to mark the entry as the most recently used
+            self._data[key] = item
+            self.hits += 1
+        return copy.deepcopy(item[1])
+
+    def put(self, key, value):
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (self._current_bucket(), value)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def get_or_call(self, key, func):
+        result = self.get(key)
+        if result is None:
+            result = func()
+            self.put(key, result)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    @property
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "size": len(self._data)}
+
+
+class _StoreEntry(object):
+    __slots__ = ("ready", "result", "failed")
+
+    def __init__(self):
+        self.ready = threading.Event()
+        self.result = None
+        self.failed = False
+
+
+class _SharedCalls(object):
+    """Base of stores which run every distinct key only once.
+
+    Concurrent requests of a key being run wait for its result. Errors
+    are never stored: the failed entry is dropped, the error is raised to
+    its owner and waiting requests run the call again.
+    """
+    def __init__(self):
+        self.requests = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get_or_call(self, key, func):
+        with self._lock:
+            self.requests += 1
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                is_owner = entry is None
+                if is_owner:
+                    entry = self._entries[key] = _StoreEntry()
+            if not is_owner:
+                entry.ready.wait()
+                if entry.failed:
+                    continue
+                return entry.result
+            try:
+                entry.result = func()
+            except Exception:
+                entry.failed = True
+                with self._lock:
+                    del self._entries[key]
+                raise
+            finally:
+                entry.ready.set()
+            return entry.result
+
+    @property
+    def dedupe_ratio(self):
+        """Count of requests per distinct query."""
+        if not self._entries:
+            return 1.0
+        return float(self.requests) / len(self._entries)
+
+    @property
+    def stats(self):
+        return {"requests": self.requests, "distinct": len(self._entries),
+                "dedupe_ratio": self.dedupe_ratio}
+
+
+class QueryStore(_SharedCalls):
+    """Store of outcomes of queries shared by all users of the same query.
+
+    Queries are keyed by normalized text and every distinct query is run
+    only once. Only the outcome is kept: True if query returned data, or
+    error message if the result is empty or query is invalid, i.e. func
+    raised KeyError or ValueError. Other errors, e.g. connection errors,
+    timeouts or HTTP 5xx responses, are raised and not stored, so the
+    query is run again by the next request. Entries never expire, so the
+    store is meant for queries whose outcome doesn't change within a test
+    session.
+    """
+    def check(self, query, func):
+        """Return outcome of func, which runs query, or stored outcome.
+
+        :returns: True or error message
+        """
+        def get_outcome():
+            try:
+                if func():
+                    return True
+                return "Empty result of query {}".format(query)
+            except (KeyError, ValueError) as e:
+                return str(e) or repr(e)
+
+        return self._get_or_call(normalize_query(query), get_outcome)
+
+
+class ValuesStore(_SharedCalls):
+    """Store of query results shared by all users of the same query.
+
+    Results are keyed by normalized query, they are shared between
+    callers and must not be modified. Entries never expire, so the store
+    is meant for results which don't change within a test session.
+    """
+    def get_or_call(self, query, func, variant=None):
+        """Return result of func, which runs query, or stored result.
+
+        :param variant: distinguishes results of the same query processed
+         in different ways, e.g. filtered by different regexes
+        """
+        return self._get_or_call((normalize_query(query), variant), func)
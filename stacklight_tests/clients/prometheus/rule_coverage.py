@@ -0,0 +1,79 @@
+import collections
+
+from stacklight_tests.clients.prometheus import promql
+
+
+def get_expression_metrics(expression):
+    """Return names of metrics used by selectors of PromQL expression.
+
+    :raises PromQLError: if expression isn't supported by the parser
+    """
+    return promql.get_metric_names(promql.parse(expression))
+
+
+class AlertRulesCoverage(object):
+    """Matrix of alert rules by metrics used in their expressions.
+
+    Every expression is parsed once, so the whole set of rules is checked
+    against one list of existing metric names. Expressions which can't be
+    parsed are kept in "errors" instead of being guessed.
+    """
+
+    def __init__(self, rules):
+        """
+        :param rules: dict of rule name to expression
+        """
+        self.metrics_by_rule = collections.OrderedDict()
+        self.errors = collections.OrderedDict()
+        for name, expression in sorted(rules.items()):
+            try:
+                self.metrics_by_rule[name] = get_expression_metrics(
+                    expression)
+            except promql.PromQLError as e:
+                self.errors[name] = str(e)
+
+    def __len__(self):
+        return len(self.metrics_by_rule)
+
+    @classmethod
+    def from_grains(cls, grains, exclude=()):
+        """Build coverage from "prometheus:server:alert" grains.
+
+        :param grains: dict of node to its alert rules grain, rules with
+         the same name are taken once
+        :param exclude: substrings of names of rules to skip
+        """
+        rules = {}
+        for node_rules in grains.values():
+            for name, rule in (node_rules or {}).items():
+                if any(pattern in name for pattern in exclude):
+                    continue
+                rules.setdefault(name, rule["if"])
+        return cls(rules)
+
+    @property
+    def metric_names(self):
+        names = set()
+        for metrics in self.metrics_by_rule.values():
+            names.update(metrics)
+        return names
+
+    def get_missing(self, existing_names):
+        """Return dict of rule name to sorted names of missing metrics.
+
+        Rules using only existing metrics are omitted.
+        """
+        existing_names = set(existing_names)
+        missing = collections.OrderedDict()
+        for name, metrics in self.metrics_by_rule.items():
+            missing_metrics = sorted(metrics - existing_names)
+            if missing_metrics:
+                missing[name] = missing_metrics
+        return missing
+
+    def check(self, prometheus_api):
+        """Check rules against metric names known to Prometheus.
+
+        All names are fetched with one label values query.
+        """
+        return self.get_missing(prometheus_api.get_label_values("__name__"))
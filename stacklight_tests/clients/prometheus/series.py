@@ -0,0 +1,160 @@
+import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Intern tables of label strings and label sets, they are shared between all
+# samples, so repeated labels of large results are stored only once.
+_interned_strings = {}
+_interned_label_sets = {}
+MAX_INTERNED = 1000000
+
+
+def _intern_string(value):
+    if len(_interned_strings) > MAX_INTERNED:
+        _interned_strings.clear()
+    return _interned_strings.setdefault(value, value)
+
+
+def make_array(values):
+    """Pack floats into NumPy array if it's available or into array('d')."""
+    if numpy is not None:
+        return numpy.array(values, dtype=float)
+    return array.array("d", values)
+
+
+class RangeSeries(object):
+    """Time series of range query result.
+
+    Timestamps and values are kept in compact typed arrays, labels are kept
+    separately in a dict.
+    """
+    __slots__ = ("labels", "timestamps", "values")
+
+    def __init__(self, labels, timestamps, values):
+        self.labels = labels
+        self.timestamps = make_array(timestamps)
+        self.values = make_array(values)
+
+    def __repr__(self):
+        return "{}: {} ({} points)".format(
+            self.__class__.__name__, self.labels, len(self))
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @classmethod
+    def from_json(cls, json_repr):
+        points = json_repr["values"]
+        return cls(json_repr["metric"],
+                   [float(ts) for ts, _ in points],
+                   [float(value) for _, value in points])
+
+    @property
+    def name(self):
+        return self.labels.get("__name__")
+
+    @property
+    def duration(self):
+        if len(self) < 2:
+            return 0.0
+        return self.timestamps[-1] - self.timestamps[0]
+
+    def get_gaps(self, max_interval):
+        """Return (start, end) pairs of intervals without samples.
+
+        :param max_interval: maximum allowed interval between two samples,
+         usually it is a bit more than query step
+        """
+        ts = self.timestamps
+        return [(ts[n - 1], ts[n]) for n in range(1, len(ts))
+                if ts[n] - ts[n - 1] > max_interval]
+
+    def increase(self):
+        """Return increase of counter with resets taken into account."""
+        result = 0.0
+        values = self.values
+        for n in range(1, len(values)):
+            delta = values[n] - values[n - 1]
+            # Counter was reset, so it counts from zero again
+            result += values[n] if delta < 0 else delta
+        return result
+
+    def rate(self):
+        """Return per-second average rate of counter over the series."""
+        duration = self.duration
+        if not duration:
+            return 0.0
+        return self.increase() / duration
+
+    def slope(self):
+        """Return per-second slope of least-squares linear regression."""
+        count = len(self)
+        if count < 2:
+            return 0.0
+        mean_ts = sum(self.timestamps) / count
+        mean_value = sum(self.values) / count
+        covariance = 0.0
+        variance = 0.0
+        for ts, value in zip(self.timestamps, self.values):
+            covariance += (ts - mean_ts) * (value - mean_value)
+            variance += (ts - mean_ts) ** 2
+        return covariance / variance if variance else 0.0
+
+
+class LabelSet(tuple):
+    """Immutable sorted tuple of (name, value) label pairs."""
+    __slots__ = ()
+
+    def get(self, name, default=None):
+        for key, value in self:
+            if key == name:
+                return value
+        return default
+
+    def to_dict(self):
+        return dict(self)
+
+    @property
+    def name(self):
+        return self.get("__name__")
+
+    @classmethod
+    def intern(cls, labels):
+        """Return shared LabelSet equal to labels dict."""
+        key = tuple(sorted((_intern_string(k), _intern_string(v))
+                           for k, v in labels.items()))
+        label_set = _interned_label_sets.get(key)
+        if label_set is None:
+            if len(_interned_label_sets) > MAX_INTERNED:
+                _interned_label_sets.clear()
+            label_set = _interned_label_sets[key] = cls(key)
+        return label_set
+
+
+class Sample(object):
+    """Single sample of instant query result."""
+    __slots__ = ("labels", "timestamp", "value")
+
+    def __init__(self, labels, timestamp, value):
+        self.labels = labels
+        self.timestamp = timestamp
+        self.value = value
+
+    def __repr__(self):
+        return "{}: {} {} @{}".format(
+            self.__class__.__name__, dict(self.labels), self.value,
+            self.timestamp)
+
+    @classmethod
+    def from_json(cls, json_repr):
+        timestamp, value = json_repr["value"]
+        return cls(LabelSet.intern(json_repr["metric"]),
+                   float(timestamp), float(value))
+
+    @property
+    def name(self):
+        return self.labels.name
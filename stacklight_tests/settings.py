@@ -19,3 +19,16 @@ CONFIGURE_APPS = ["nodes", "influxdb", "elasticsearch", "grafana",
                   "keystone", "mysql", "prometheus", "alerta", "mongodb"]
 
 VOLUME_STATUS = os.environ.get("VOLUME_STATUS", "available")
+
+# HTTP connection pooling for API clients
+HTTP_POOL_CONNECTIONS = int(os.environ.get("HTTP_POOL_CONNECTIONS", 10))
+HTTP_POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", 20))
+
+# Default count of threads for concurrent API requests
+MAX_WORKERS = int(os.environ.get("MAX_WORKERS", 10))
+
+# Strategy of combining values of dependent Grafana templates in panel
+# checks: "product", "each", "pairwise" or "random"
+TEMPLATES_STRATEGY = os.environ.get("TEMPLATES_STRATEGY", "product")
+TEMPLATES_SAMPLE_SIZE = int(os.environ.get("TEMPLATES_SAMPLE_SIZE", 100))
+TEMPLATES_SEED = int(os.environ.get("TEMPLATES_SEED", 0))
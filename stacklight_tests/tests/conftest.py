@@ -1,8 +1,11 @@
+from alertaclient import exceptions as alerta_exceptions
 import logging
 import pytest
+import requests
 import time
 
 from stacklight_tests.clients.fixtures import *  # noqa
+from stacklight_tests.clients.prometheus import alert_latency as latency
 
 
 logger = logging.getLogger(__name__)
@@ -26,3 +29,26 @@ def destructive(request):
                 logger.error(
                     "Recovery failed: {} with exception: {}".format(
                         recovery_method, e))
+
+
+@pytest.fixture
+def alert_latency(request, prometheus_api, prometheus_native_alerting):
+    """Measures latencies of alert pipeline stages after faults marked
+    by test and logs them per alert rule.
+    """
+    try:
+        alerta_api = request.getfixturevalue("alerta_api")
+    except pytest.skip.Exception:
+        logger.info("Alerta is not configured, its latency is not measured")
+        alerta_api = None
+    except (requests.RequestException,
+            alerta_exceptions.AlertaException) as e:
+        logger.warning("Alerta is not available, its latency is not "
+                       "measured: {}".format(e))
+        alerta_api = None
+    tracker = latency.AlertLatencyTracker(
+        prometheus_api, prometheus_native_alerting, alerta_api)
+    yield tracker
+    if tracker.records:
+        logger.info("Alert pipeline latencies after the fault:\n{}".format(
+            tracker.format_report()))
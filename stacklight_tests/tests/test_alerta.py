@@ -1,7 +1,8 @@
 import logging
 import pytest
-import datetime
 
+from stacklight_tests.clients.prometheus import alert_consistency
+from stacklight_tests.clients.prometheus import rule_coverage
 from stacklight_tests import utils
 
 logger = logging.getLogger(__name__)
@@ -16,25 +17,21 @@ def test_alerta_smoke(alerta_api):
 @pytest.mark.alerta
 @pytest.mark.smoke
 def test_alerta_alerts_consistency(prometheus_native_alerting, alerta_api):
-    def check_alerts(alert_age=300):
-        time_now = datetime.datetime.now()
-        alerta_alerts = {"{0} {1}".format(i.event, i.resource)
-                         for i in alerta_api.get_alerts({"status": "open"})}
-        alertmanager_alerts = {
-            "{0} {1}".format(i.name, i.instance)
-            for i in prometheus_native_alerting.list_alerts()
-            if prometheus_native_alerting.get and
-            utils.difference_in_seconds(utils.convert_unicode_to_datetime(
-                                        list(i.time)[0]), time_now, alert_age)}
-        if alertmanager_alerts.issubset(alerta_alerts):
+    checker = alert_consistency.AlertConsistencyChecker(
+        prometheus_native_alerting, alerta_api, min_age=300)
+
+    def check_alerts():
+        delta = checker.update()
+        if any(delta):
+            logger.info("Alerts changed: {}".format(delta))
+        missing_in_alerta = checker.get_missing_in_alerta()
+        if not missing_in_alerta:
             return True
-        else:
-            logger.info(
-                "Alerts in Alerta and NOT in AlertManager: {0}\n"
-                "Alerts in AlertManager and NOT in Alerta: {1}".format(
-                    alerta_alerts.difference(alertmanager_alerts),
-                    alertmanager_alerts.difference(alerta_alerts)))
-            return False
+        logger.info(
+            "Alerts in Alerta and NOT in AlertManager: {0}\n"
+            "Alerts in AlertManager and NOT in Alerta: {1}".format(
+                checker.get_missing_in_alertmanager(), missing_in_alerta))
+        return False
 
     utils.wait(check_alerts, interval=30, timeout=6 * 60,
                timeout_msg="Alerts in Alertmanager and Alerta inconsistent")
@@ -64,34 +61,21 @@ def test_mongodb_configuration(salt_actions, mongodb_api):
     assert repl == mongo_status["repl"]["setName"]
 
 
-@pytest.mark.skip(reason="Temporary disabling")
+@pytest.mark.alerta
+@pytest.mark.smoke
 def test_alerts_metrics(salt_actions, prometheus_api):
-    def filter_expr(s):
-        for ch in ["(", ")", "[", "]"]:
-            if ch in s:
-                s = s.replace(ch, " ")
-        m = list(set([i.strip(",") for i in s.split() if "_" in i]))
-        for i in ["label_replace", "avg_over_time", "process_name"]:
-            if i in m:
-                m.remove(i)
-        return m
-
-    nodes = salt_actions.ping()
-    for node in nodes:
-        # Get list of alerts for the node
-        grains = salt_actions.get_grains(node, "prometheus:server:alert",
-                                         tgt_type="glob").values()[0]
-        # Alerts to exclude because metrics for them may not exist
-        exc = ["ErrorLogs", "KeystoneApiResponse", "NovaAggregate",
-               "SshFailedLogins", "SystemDiskErrorsTooHigh"]
-        alerts = [i for i in grains.keys() if not any(ex in i for ex in exc)]
-        # Generate dict {Alertname: expression}
-        metrics_dict = {i: grains[i]["if"] for i in alerts}
-        # Generate dict {Alertname: [metrics]}
-        d = {i: filter_expr(metrics_dict[i]) for i in metrics_dict.keys()}
-        for alertname, metrics in d.items():
-            for m in metrics:
-                q = prometheus_api.get_query(m)
-                assert q and len(prometheus_api.get_query(m)) != 0, \
-                    "{} metric for {} alert not found for {} node".format(
-                        m, alertname, node)
+    grains = salt_actions.get_grains("*", "prometheus:server:alert",
+                                     tgt_type="glob")
+    # Alerts to exclude because metrics for them may not exist
+    exc = ["ErrorLogs", "KeystoneApiResponse", "NovaAggregate",
+           "SshFailedLogins", "SystemDiskErrorsTooHigh"]
+    coverage = rule_coverage.AlertRulesCoverage.from_grains(grains, exc)
+    # Syntax unsupported by the parser isn't a missing metric, so such
+    # rules are only reported
+    for alertname, error in coverage.errors.items():
+        logger.warning("Metrics of {} are not checked: {}".format(
+            alertname, error))
+    missing = coverage.check(prometheus_api)
+    msg = "\n".join("{}: {}".format(alertname, ", ".join(metrics))
+                    for alertname, metrics in missing.items())
+    assert not missing, "Metrics not found for alerts:\n{}".format(msg)
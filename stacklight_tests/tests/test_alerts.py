@@ -90,16 +90,12 @@ service_down_entities = {
 
 @pytest.mark.alerts
 class TestPrometheusAlerts(object):
-    def test_system_load_alerts(self, cluster, prometheus_alerting):
-        def check_status(is_fired=True):
-            alert_names = ["SystemLoad5", "AvgCPUUsageIdle"]
-            for alert_name in alert_names:
-                criteria = {
-                    "name": alert_name,
-                    "host": compute.hostname,
-                }
-                prometheus_alerting.check_alert_status(
-                    criteria, is_fired=is_fired, timeout=6 * 60)
+    def test_system_load_alerts(self, cluster, prometheus_alerting,
+                                alert_latency):
+        def check_status(is_fired=True, companions=()):
+            expectations = [(criteria, is_fired) for criteria in alerts]
+            prometheus_alerting.check_alerts_statuses(
+                expectations, timeout=6 * 60, companions=companions)
 
         load_processes_count = 20
 
@@ -108,9 +104,15 @@ class TestPrometheusAlerts(object):
         compute = [host for host in cluster.hosts
                    if host.fqdn.startswith("cmp")][0]
 
+        alerts = [{"name": alert_name, "host": compute.hostname}
+                  for alert_name in ["SystemLoad5", "AvgCPUUsageIdle"]]
+
         check_status(is_fired=False)
+        for criteria in alerts:
+            alert_latency.mark_fault(criteria)
         with compute.os.make_temporary_load(load_processes_count):
-            check_status()
+            check_status(companions=[alert_latency])
+            alert_latency.collect(timeout=2 * 60)
         check_status(is_fired=False)
 
     def test_system_mem_alert(self, cluster, prometheus_alerting):
@@ -193,7 +195,8 @@ class TestPrometheusAlerts(object):
         "entities", service_down_entities.values(),
         ids=service_down_entities.keys())
     def test_service_down_alerts(self, cluster, destructive,
-                                 prometheus_alerting, entities):
+                                 prometheus_alerting, alert_latency,
+                                 entities):
         service = entities[0]
         roles = entities[1]
         target_nodes = []
@@ -210,12 +213,15 @@ class TestPrometheusAlerts(object):
         prometheus_alerting.check_alert_status(criteria, is_fired=False)
         logger.info("Stop {} service on {} node(s)".format(
             service, ', '.join([str(n.hostname) for n in target_nodes])))
+        alert_latency.mark_fault(criteria)
         for node in target_nodes:
             destructive.append(
                 lambda: node.os.manage_service(service, "start"))
             node.os.manage_service(service, "stop")
         prometheus_alerting.check_alert_status(
-            criteria, is_fired=True, timeout=10 * 60)
+            criteria, is_fired=True, timeout=10 * 60,
+            companions=[alert_latency])
+        alert_latency.collect(timeout=2 * 60)
         logger.info("Start {} service on {} node(s)".format(
             service, ', '.join([str(n.hostname) for n in target_nodes])))
         for node in target_nodes:
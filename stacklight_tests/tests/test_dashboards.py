@@ -1,7 +1,14 @@
 import collections
+import logging
 
 import pytest
 
+from stacklight_tests.clients.prometheus import query_cache
+from stacklight_tests import utils
+
+
+logger = logging.getLogger(__name__)
+
 
 ignored_queries_for_fail = [
     # Cinder. Default installation does not contain cinder-volume
@@ -643,6 +650,59 @@ class Panel(object):
         return self.print_panel_detail()
 
 
+def check_panel_query(prometheus_api, query):
+    result = prometheus_api.do_query(query)
+    if not result:
+        raise ValueError("Empty result of query {}".format(query))
+    return result
+
+
+def validate_dashboard_panels(dashboard, prometheus_api, store=None,
+                              max_workers=None):
+    """Run queries of all panels for all templates concurrently.
+
+    The whole list of (panel, compiled query) pairs is built first and
+    queries are run on a bounded pool of threads.
+
+    :param store: QueryStore to share outcomes of the same queries between
+     panels and dashboards
+    :returns: list of Panel with statuses of all their queries
+    """
+    if store is None:
+        store = query_cache.QueryStore()
+    panels = []
+    work_list = []
+    for location, raw_query in dashboard.get_panel_queries().items():
+        panel = Panel(location, raw_query)
+        panels.append(panel)
+        for template in dashboard.get_all_templates_for_query(raw_query):
+            query = prometheus_api.compile_query(raw_query, template)
+            work_list.append((panel, query))
+
+    results = utils.map_concurrently(
+        lambda item: store.check(
+            item[1], lambda: check_panel_query(prometheus_api, item[1])),
+        work_list, max_workers=max_workers)
+    for (panel, query), (outcome, error) in zip(work_list, results):
+        if error is not None:
+            raise error
+        if outcome is True:
+            panel.add_query(query, PanelStatus.ok)
+        else:
+            logger.debug("Panel query failed: {}".format(outcome))
+            panel.add_query(query, PanelStatus.fail)
+    return panels
+
+
+@pytest.fixture(scope="session")
+def panel_query_store():
+    """Outcomes of compiled panel queries shared by all dashboards."""
+    store = query_cache.QueryStore()
+    yield store
+    logger.info("Panel queries: {requests} requested, {distinct} distinct, "
+                "dedupe ratio {dedupe_ratio:.2f}".format(**store.stats))
+
+
 @pytest.fixture(scope="module",
                 params=get_all_grafana_dashboards_names().items(),
                 ids=get_all_grafana_dashboards_names().keys())
@@ -659,7 +719,7 @@ def dashboard_name(request, salt_actions):
 @pytest.mark.dashboards
 @pytest.mark.run(order=-1)
 def test_grafana_dashboard_panel_queries(
-        dashboard_name, grafana_client, prometheus_api):
+        dashboard_name, grafana_client, prometheus_api, panel_query_store):
 
     grafana_client.check_grafana_online()
     dashboard = grafana_client.get_dashboard(dashboard_name)
@@ -669,21 +729,8 @@ def test_grafana_dashboard_panel_queries(
 
     dashboard_results = collections.defaultdict(list)
 
-    for location, raw_query in dashboard.get_panel_queries().items():
-        possible_templates = dashboard.get_all_templates_for_query(raw_query)
-
-        panel = Panel(location, raw_query)
-
-        for template in possible_templates:
-            query = prometheus_api.compile_query(raw_query, template)
-            try:
-                result = prometheus_api.do_query(query)
-                if not result:
-                    raise ValueError
-                panel.add_query(query, PanelStatus.ok)
-            except (KeyError, ValueError):
-                panel.add_query(query, PanelStatus.fail)
-
+    for panel in validate_dashboard_panels(dashboard, prometheus_api,
+                                           store=panel_query_store):
         dashboard_results[panel.status].append(panel)
 
     error_msg = (
@@ -65,16 +65,17 @@ class TestMetrics(object):
     def test_system_metrics(self, prometheus_api, salt_actions,
                             target, metrics):
         expected_hostnames = salt_actions.ping(short=True)
+        hostnames = []
         for hostname in expected_hostnames:
             if "SKIP_NODES" in os.environ.keys():
                 if hostname in os.environ['SKIP_NODES']:
                     print "Skip {}".format(hostname)
                     continue
-            for metric in metrics:
-                q = ('{}{{host="{}"}}'.format(metric, hostname))
-                msg = "Metric {} not found".format(q)
-                output = prometheus_api.get_query(q)
-                assert len(output) != 0, msg
+            hostnames.append(hostname)
+        matrix = prometheus_api.get_presence_matrix(metrics)
+        missing = ['{}{{host="{}"}}'.format(metric, hostname)
+                   for hostname, metric in matrix.get_missing(hostnames)]
+        assert not missing, "Metrics not found: {}".format(missing)
 
     @pytest.mark.run(order=2)
     def test_k8s_metrics(self, salt_actions, prometheus_api):
@@ -89,12 +90,9 @@ class TestMetrics(object):
             'kubernetes_system_container_rootfs_available_bytes'
         ]
 
-        for metric in metrics:
-            q = ('{{__name__=~"{}"}}'.format(metric))
-            output = prometheus_api.get_query(q)
-            logger.info("Waiting to get metric {}".format(metric))
-            msg = "Metric {} not found".format(metric)
-            assert len(output) != 0, msg
+        matrix = prometheus_api.get_presence_matrix(metrics)
+        missing = matrix.get_missing_metrics()
+        assert not missing, "Metrics not found: {}".format(missing)
 
     @pytest.mark.run(order=2)
     def test_mysql_metrics(self, salt_actions, prometheus_api):
@@ -136,14 +134,11 @@ class TestMetrics(object):
         for handler in handlers:
             expected_metrics.append("mysql_handler_{}".format(handler))
 
-        for host in mysql_hosts:
-            for metric in expected_metrics:
-                hostname = host.split(".")[0]
-                q = '{}{{host="{}"}}'.format(metric, hostname)
-                output = prometheus_api.get_query(q)
-                logger.info("Waiting to get metric {}".format(q))
-                msg = "Metric {} not found".format(q)
-                assert len(output) != 0, msg
+        hostnames = [host.split(".")[0] for host in mysql_hosts]
+        matrix = prometheus_api.get_presence_matrix(expected_metrics)
+        missing = ['{}{{host="{}"}}'.format(metric, hostname)
+                   for hostname, metric in matrix.get_missing(hostnames)]
+        assert not missing, "Metrics not found: {}".format(missing)
 
     @pytest.mark.run(order=1)
     @pytest.mark.smoke
@@ -187,14 +182,18 @@ class TestMetrics(object):
                 target_dict[service] = len(salt_actions.ping(pillar))
         logger.info("Got the following dict to check:\n{}".format(target_dict))
 
-        for target, count in target_dict.items():
-            q = 'up{{job="{}"}}'.format(target)
-            output = prometheus_api.get_query(q)
+        watcher = prometheus_api.get_metric_values_watcher()
+        targets = target_dict.keys()
+        results = prometheus_api.get_queries(
+            ['up{{job="{}"}}'.format(target) for target in targets])
+        for target, (q, output, error) in zip(targets, results):
+            count = target_dict[target]
+            assert error is None, "Query {} failed: {}".format(q, error)
             logger.info('Got {} metrics for {} query'.format(output, q))
             msg = ('Incorrect count of metrics for {} target. '
                    'Received list {}'.format(target, output))
             assert len(output) == count, msg
-            prometheus_api.check_metric_values(q, 1)
+            watcher.add(q, 1)
 
         service_dict = {
             'telegraf': 'I@telegraf:agent or I@telegraf:remote_agent',
@@ -204,29 +203,31 @@ class TestMetrics(object):
             'libvirt_qemu_exporter': 'I@prometheus:exporters:libvirt',
             'jmx_cassandra_exporter': 'I@prometheus:exporters:jmx'
         }
+        queries = []
         for service, tgt in service_dict.items():
             nodes = salt_actions.ping(tgt, short=True)
             for node in nodes:
-                q = ('up{{host="{}",job="{}"}}'.format(node, service))
-                output = prometheus_api.get_query(q)
-                logger.info("Waiting to get metric {}".format(q))
-                msg = "Metric {} not found".format(q)
-                assert len(output) != 0, msg
-                prometheus_api.check_metric_values(q, 1)
+                queries.append(
+                    'up{{host="{}",job="{}"}}'.format(node, service))
+        for q, output, error in prometheus_api.get_queries(queries):
+            logger.info("Waiting to get metric {}".format(q))
+            assert error is None, "Query {} failed: {}".format(q, error)
+            msg = "Metric {} not found".format(q)
+            assert len(output) != 0, msg
+            watcher.add(q, 1)
+        watcher.wait(timeout_msg="Some targets are not up")
 
     @pytest.mark.run(order=1)
     @pytest.mark.smoke
     def test_up_metrics(self, prometheus_api):
         q = '{__name__=~".*_up", __name__!~"ceph_num_mds_up"}'
-        metrics = prometheus_api.get_query(q)
-        for metric in metrics:
-            msg = 'Metric {} has value {}'.format(
-                metric['metric']['__name__'], metric['value'])
-            if metric.get('metric').get('host', ''):
-                msg = msg + ' on the node {}'.format(metric['metric']['host'])
+        for metric in prometheus_api.iter_samples(q):
+            msg = 'Metric {} has value {}'.format(metric.name, metric.value)
+            if metric.labels.get('host', ''):
+                msg = msg + ' on the node {}'.format(metric.labels.get('host'))
             logger.info(msg)
             err_msg = 'Incorrect value in metric {}'.format(metric)
-            assert '1' in metric['value'], err_msg
+            assert metric.value == 1, err_msg
 
     @pytest.mark.run(order=2)
     def test_ovs_metrics(self, prometheus_api, salt_actions):
@@ -185,19 +185,21 @@ class TestOpenstackMetrics(object):
                                "nova-scheduler"]
         compute_services = ["nova-compute"]
         err_service_msg = "Service {} is down on the {} node"
+        watcher = prometheus_api.get_metric_values_watcher()
         for controller in controllers:
             for service in controller_services:
                 q = 'hostname="{}",service="{}"'.format(controller, service)
-                prometheus_api.check_metric_values(
+                watcher.add(
                     'openstack_nova_service{' + q + '}',
                     0,
                     err_service_msg.format(service, controller))
         for compute in computes:
             for service in compute_services:
                 q = 'hostname="{}",service="{}"'.format(compute, service)
-                prometheus_api.check_metric_values(
+                watcher.add(
                     'openstack_nova_service{' + q + '}',
                     0, err_service_msg.format(service, compute))
+        watcher.wait(timeout_msg="Some nova services are down")
 
     @pytest.mark.run(order=2)
     def test_http_response_metrics(self, prometheus_api, salt_actions):
@@ -221,6 +223,7 @@ class TestOpenstackMetrics(object):
         logger.info("\nGot the following dict to check:\n{}\n".format(
             target_dict))
 
+        watcher = prometheus_api.get_metric_values_watcher()
         for node in target_dict.keys():
             host = node.split(".")[0]
             for service in target_dict[node]:
@@ -230,7 +233,8 @@ class TestOpenstackMetrics(object):
                 logger.info("Waiting to get metric {}".format(q))
                 msg = "Metric {} not found".format(q)
                 assert len(output) != 0, msg
-                prometheus_api.check_metric_values(q, 1)
+                watcher.add(q, 1)
+        watcher.wait(timeout_msg="Some http responses are not successful")
 
     @pytest.mark.run(order=1)
     def test_openstack_api_check_status_metrics(self, prometheus_api,
@@ -0,0 +1,13 @@
+import pytest
+
+
+# Unit tests run offline, so environment checks of the parent conftest
+# are replaced with no-op fixtures of the same names.
+@pytest.fixture(autouse=True)
+def env_requirements():
+    pass
+
+
+@pytest.fixture(autouse=True)
+def skip_if_no_sl():
+    pass
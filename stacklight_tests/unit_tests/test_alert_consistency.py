@@ -0,0 +1,136 @@
+import collections
+import datetime as dt
+
+from stacklight_tests.clients.prometheus import alert_consistency
+
+
+AlertManagerAlert = collections.namedtuple(
+    "AlertManagerAlert", ["name", "instance", "time", "fingerprint",
+                          "started_at"])
+AlertaAlert = collections.namedtuple(
+    "AlertaAlert", ["id", "event", "resource", "status"])
+
+OLD = dt.datetime.utcnow() - dt.timedelta(hours=1)
+
+
+def alertmanager_alert(name, instance="ctl01", started_at=OLD):
+    return AlertManagerAlert(name, instance, None, "fp-" + name, started_at)
+
+
+def alerta_alert(name, resource="ctl01", status="open"):
+    return AlertaAlert("id-" + name, name, resource, status)
+
+
+class FakeAlertManagerApi(object):
+    def __init__(self):
+        self.alerts = []
+
+    def list_alerts(self):
+        return list(self.alerts)
+
+
+class FakeAlertaApi(object):
+    """Full sync returns all open alerts, incremental one returns alerts
+    changed since the last call.
+    """
+    def __init__(self):
+        self.alerts = {}
+        self.changed = []
+        self.queries = []
+
+    def set(self, *alerts):
+        for alert in alerts:
+            self.alerts[alert.id] = alert
+            self.changed.append(alert)
+
+    def get_alerts(self, query):
+        self.queries.append(query)
+        changed, self.changed = self.changed, []
+        if "from-date" in query:
+            return changed
+        return [alert for alert in self.alerts.values()
+                if alert.status == "open"]
+
+
+def make_checker(**kwargs):
+    alertmanager_api, alerta_api = FakeAlertManagerApi(), FakeAlertaApi()
+    checker = alert_consistency.AlertConsistencyChecker(
+        alertmanager_api, alerta_api, **kwargs)
+    return checker, alertmanager_api, alerta_api
+
+
+def test_consistent_alerts():
+    checker, alertmanager_api, alerta_api = make_checker()
+    alertmanager_api.alerts = [alertmanager_alert("CpuHigh")]
+    alerta_api.set(alerta_alert("CpuHigh"))
+    delta = checker.update()
+    assert delta.alertmanager_added == {"CpuHigh ctl01"}
+    assert delta.alerta_added == {"CpuHigh ctl01"}
+    assert checker.get_missing_in_alerta() == set()
+    assert checker.get_missing_in_alertmanager() == set()
+    assert checker.update() == (set(), set(), set(), set())
+
+
+def test_missing_alerts():
+    checker, alertmanager_api, alerta_api = make_checker()
+    alertmanager_api.alerts = [
+        alertmanager_alert("CpuHigh"),
+        alertmanager_alert("DiskFull", started_at=dt.datetime.utcnow())]
+    alerta_api.set(alerta_alert("MemHigh"))
+    checker.update()
+    # Fresh alert may not be delivered to Alerta yet
+    assert checker.get_missing_in_alerta() == {"CpuHigh ctl01"}
+    assert checker.get_missing_in_alertmanager() == {"MemHigh ctl01"}
+
+
+def test_incremental_updates():
+    checker, alertmanager_api, alerta_api = make_checker()
+    alertmanager_api.alerts = [alertmanager_alert("CpuHigh")]
+    alerta_api.set(alerta_alert("CpuHigh"))
+    checker.update()
+
+    alertmanager_api.alerts = [alertmanager_alert("DiskFull")]
+    alerta_api.set(alerta_alert("CpuHigh", status="closed"),
+                   alerta_alert("DiskFull"))
+    delta = checker.update()
+    assert "from-date" in alerta_api.queries[-1]
+    assert delta == ({"DiskFull ctl01"}, {"CpuHigh ctl01"},
+                     {"DiskFull ctl01"}, {"CpuHigh ctl01"})
+    assert checker.get_missing_in_alerta() == set()
+    assert checker.get_missing_in_alertmanager() == set()
+
+
+def test_closing_unknown_alert_isnt_reported():
+    checker, _, alerta_api = make_checker()
+    checker.update()
+    alerta_api.set(alerta_alert("CpuHigh", status="closed"))
+    assert checker.update().alerta_removed == set()
+
+
+def test_full_sync_removes_silently_expired_alerts():
+    checker, _, alerta_api = make_checker(full_sync_every=3)
+    alerta_api.set(alerta_alert("CpuHigh"))
+    checker.update()
+    # Alert expires without being received again, so incremental updates
+    # don't see it
+    del alerta_api.alerts["id-CpuHigh"]
+    for _ in range(2):
+        checker.update()
+        assert checker.get_missing_in_alertmanager() == {"CpuHigh ctl01"}
+    delta = checker.update()
+    assert "from-date" not in alerta_api.queries[-1]
+    assert delta.alerta_removed == {"CpuHigh ctl01"}
+    assert checker.get_missing_in_alertmanager() == set()
+    assert ["from-date" in query for query in alerta_api.queries] == [
+        False, True, True, False]
+
+
+def test_start_time_is_kept_from_first_sight():
+    checker, alertmanager_api, _ = make_checker()
+    alertmanager_api.alerts = [alertmanager_alert("CpuHigh")]
+    checker.update()
+    # Same fingerprint, start time isn't parsed again
+    alertmanager_api.alerts = [
+        alertmanager_alert("CpuHigh", started_at=dt.datetime.utcnow())]
+    assert checker.update().alertmanager_added == set()
+    assert checker.get_missing_in_alerta() == {"CpuHigh ctl01"}
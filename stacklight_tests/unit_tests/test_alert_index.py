@@ -0,0 +1,83 @@
+from stacklight_tests.clients.prometheus import alertmanager_client
+
+
+def make_alert(name, host, service="system", value=True):
+    return alertmanager_client.PrometheusQueryAlert(
+        name, None, host, service, "warning", "{}:9100".format(host),
+        value=value)
+
+
+class CountingAlert(alertmanager_client.PrometheusQueryAlert):
+    __slots__ = ()
+    checks = 0
+
+    def is_appropriate(self, **criteria):
+        CountingAlert.checks += 1
+        return super(CountingAlert, self).is_appropriate(**criteria)
+
+
+class FakeAlerting(alertmanager_client.AlertBehaviorMixin):
+    def __init__(self, alerts):
+        self.alerts = alerts
+        self.requests = []
+
+    def list_alerts(self, **criteria):
+        self.requests.append(criteria)
+        return [alert for alert in self.alerts
+                if alert.is_appropriate(**criteria)]
+
+
+alerts = [make_alert("SystemLoad5", "cmp01"),
+          make_alert("SystemLoad5", "cmp02", value=False),
+          make_alert("AvgCPUUsageIdle", "cmp01"),
+          make_alert("NovaApiDown", "ctl01", service="nova")]
+
+
+def test_find_intersects_criteria():
+    index = alertmanager_client.AlertIndex(alerts)
+    assert index.find(name="SystemLoad5") == alerts[:2]
+    assert index.find(name="SystemLoad5", host="cmp02") == [alerts[1]]
+    assert index.find(host="cmp01", service="system") == [
+        alerts[0], alerts[2]]
+    assert index.find(instance="ctl01:9100") == [alerts[3]]
+    assert index.find(name="NovaApiDown", host="cmp01") == []
+    assert index.find(name="Unknown") == []
+    assert index.find() == alerts
+
+
+def test_find_touches_only_matching_alerts():
+    index = alertmanager_client.AlertIndex(
+        [CountingAlert("Alert{}".format(n % 10), None, "node{}".format(n),
+                       "system", "warning", None, value=True)
+         for n in range(1000)])
+    CountingAlert.checks = 0
+    assert len(index.find(name="Alert3", host="node503")) == 1
+    assert len(index.find(name="Alert3", host="node503")) == 1
+    # Indexed criteria don't need alerts to be checked one by one
+    assert CountingAlert.checks == 1
+
+
+def test_get_alert_status():
+    index = alertmanager_client.AlertIndex(alerts)
+    assert index.get_alert_status({"name": "SystemLoad5", "host": "cmp01"})
+    assert not index.get_alert_status(
+        {"name": "SystemLoad5", "host": "cmp02"})
+    assert not index.get_alert_status({"name": "Unknown"})
+
+
+def test_mixin_uses_filtered_index():
+    client = FakeAlerting(alerts)
+    criteria = {"name": "NovaApiDown", "service": "nova"}
+    assert client.get_alert_by_filter(**criteria) is alerts[3]
+    assert client.get_alert_status(criteria)
+    assert client.requests == [criteria, criteria]
+
+
+def test_alert_status_watcher():
+    client = FakeAlerting(alerts)
+    watcher = client.get_alert_status_watcher(interval=0, timeout=1)
+    watcher.add({"name": "SystemLoad5", "host": "cmp01"})
+    watcher.add({"name": "SystemLoad5", "host": "cmp02"}, is_fired=False)
+    assert len(watcher.wait()) == 2
+    # All criteria are checked against one snapshot
+    assert client.requests == [{}]
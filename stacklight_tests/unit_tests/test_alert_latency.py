@@ -0,0 +1,66 @@
+import time
+
+import pytest
+
+from stacklight_tests.clients.prometheus import alert_latency
+from stacklight_tests.clients.prometheus import alertmanager_client
+from stacklight_tests.clients.prometheus import series
+
+
+class FakePrometheus(object):
+    def __init__(self):
+        self.firing_at = None
+
+    def get_query_range(self, query, start, end, step):
+        if self.firing_at is None:
+            return []
+        return [series.RangeSeries({"alertstate": "firing"},
+                                   [self.firing_at], [1])]
+
+
+class FakeAlerting(alertmanager_client.AlertBehaviorMixin):
+    def __init__(self, name, host, fired_at):
+        self.alert = alertmanager_client.PrometheusQueryAlert(
+            name, None, host, "system", "warning", host, value=False)
+        self.fired_at = fired_at
+
+    def list_alerts(self, **criteria):
+        self.alert.value = time.time() >= self.fired_at
+        return [self.alert]
+
+
+def test_alertmanager_stage_is_recorded_while_waiting(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: clock[0])
+    monkeypatch.setattr(
+        time, "sleep", lambda seconds: clock.__setitem__(0, clock[0] + 5))
+    prometheus = FakePrometheus()
+    alertmanager = FakeAlerting("SystemLoad5", "cmp01", 1010.0)
+    # Alert status is checked by a client which sees the alert later
+    alerting = FakeAlerting("SystemLoad5", "cmp01", 1020.0)
+    tracker = alert_latency.AlertLatencyTracker(prometheus, alertmanager)
+    criteria = {"name": "SystemLoad5", "host": "cmp01"}
+    tracker.mark_fault(criteria)
+    prometheus.firing_at = 1003.0
+
+    alerting.check_alert_status(criteria, timeout=60, companions=[tracker])
+    report = tracker.collect(timeout=60)
+    assert report["SystemLoad5"][0]["firing"] == 3.0
+    # The stage is taken from the tick of the wait, when the alert came,
+    # and not from the later call of collect
+    assert report["SystemLoad5"][0]["alertmanager"] == 10.0
+
+
+def test_collect_swallows_only_timeout(monkeypatch):
+    prometheus = FakePrometheus()
+    tracker = alert_latency.AlertLatencyTracker(prometheus, interval=0)
+    tracker.mark_fault({"name": "SystemLoad5"})
+    report = tracker.collect(timeout=0.01)
+    assert report["SystemLoad5"][0]["firing"] is None
+
+    def fail(*args):
+        raise IOError("Connection refused")
+
+    monkeypatch.setattr(prometheus, "get_query_range", fail)
+    with pytest.raises(IOError):
+        tracker.collect(timeout=0.01)
@@ -0,0 +1,83 @@
+from stacklight_tests.clients.prometheus import alertmanager_client
+from stacklight_tests.clients.prometheus import series
+
+
+STEP = 10
+
+
+def alert_series(state, timestamps, name="CpuHigh", host="ctl01"):
+    return series.RangeSeries(
+        {"__name__": "ALERTS", "alertname": name, "alertstate": state,
+         "host": host}, timestamps, [1] * len(timestamps))
+
+
+def for_state_series(points, name="CpuHigh", host="ctl01"):
+    return series.RangeSeries(
+        {"__name__": "ALERTS_FOR_STATE", "alertname": name, "host": host},
+        [ts for ts, _ in points], [value for _, value in points])
+
+
+def build(result, start=0, end=200):
+    return alertmanager_client.AlertTimeline.from_series(
+        result, start, end, STEP)
+
+
+def describe(timeline):
+    return [(interval.state, interval.start, interval.end, interval.resolved)
+            for interval in timeline]
+
+
+def test_pending_then_firing_then_resolved():
+    timeline = build([alert_series("pending", [10, 20, 30]),
+                      alert_series("firing", [40, 50, 60])])
+    assert describe(timeline) == [("pending", 10, 30, False),
+                                  ("firing", 40, 60, True)]
+    assert timeline.get_firing_count(name="CpuHigh") == 1
+    assert timeline.get_firing_duration(host="ctl01") == 20
+
+
+def test_gap_splits_interval():
+    timeline = build([alert_series("firing", [10, 20, 50, 60])])
+    assert describe(timeline) == [("firing", 10, 20, True),
+                                  ("firing", 50, 60, True)]
+    assert timeline.get_firing_count() == 2
+    assert timeline.get_firing_duration() == 20
+
+
+def test_gap_shorter_than_one_and_a_half_step_is_ignored():
+    timeline = build([alert_series("firing", [10, 20, 35, 45])])
+    assert describe(timeline) == [("firing", 10, 45, True)]
+
+
+def test_alert_firing_at_window_end_isnt_resolved():
+    timeline = build([alert_series("firing", [180, 190, 200])])
+    assert describe(timeline) == [("firing", 180, 200, False)]
+
+
+def test_unsorted_and_different_alerts():
+    timeline = build([
+        alert_series("firing", [30, 10, 20], host="ctl02"),
+        alert_series("firing", [50], name="DiskFull"),
+    ])
+    assert [(interval.name, interval.labels["host"], interval.start)
+            for interval in timeline] == [("CpuHigh", "ctl02", 10),
+                                          ("DiskFull", "ctl01", 50)]
+    assert len(timeline.find(host="ctl02")) == 1
+    assert timeline.find(name="CpuHigh", state="pending") == []
+    assert "__name__" not in timeline.intervals[0].labels
+    assert "alertstate" not in timeline.intervals[0].labels
+
+
+def test_active_at_is_taken_from_alerts_for_state():
+    timeline = build([
+        alert_series("pending", [10, 20]),
+        alert_series("firing", [30]),
+        for_state_series([(10, 5), (20, 5), (30, 5)]),
+    ])
+    assert [interval.active_at for interval in timeline] == [5, 5]
+
+
+def test_empty_result():
+    timeline = build([])
+    assert len(timeline) == 0
+    assert timeline.get_firing_duration() == 0
@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from stacklight_tests.clients.prometheus import alertmanager_client
+
+
+class FakeAlertManagerClient(alertmanager_client.AlertManagerClient):
+    def __init__(self, api_version="v1", fail_create=(), fail_delete=False):
+        super(FakeAlertManagerClient, self).__init__(
+            "http://alertmanager", api_version=api_version)
+        self.fail_create = fail_create
+        self.fail_delete = fail_delete
+        self.requests = []
+
+    def request(self, url, method, headers=None, body=None, **kwargs):
+        self.requests.append((method, url))
+        if method == "POST":
+            name = json.loads(body)["matchers"][0]["value"]
+            if name in self.fail_create:
+                raise IOError("Can't create silence of {}".format(name))
+            return {}, json.dumps({"data": {"silenceId": name}})
+        if method == "DELETE" and self.fail_delete:
+            raise IOError("Can't expire silence")
+        return {}, "{}"
+
+
+def test_add_silences_raises_original_error():
+    client = FakeAlertManagerClient(fail_create=("b",), fail_delete=True)
+    with pytest.raises(IOError) as e:
+        client.add_silences([{"name": "a"}, {"name": "b"}])
+    assert "silence of b" in str(e.value)
+    assert ("DELETE", "/api/v1/silence/a") in client.requests
+
+
+def test_silenced_raises_error_of_block():
+    client = FakeAlertManagerClient(fail_delete=True)
+    with pytest.raises(KeyError):
+        with client.silenced([{"name": "a"}]):
+            raise KeyError("a")
+    assert client.requests[-1] == ("DELETE", "/api/v1/silence/a")
+
+
+def test_silenced_expires_silences():
+    client = FakeAlertManagerClient()
+    with client.silenced([{"name": "a"}]) as silence_ids:
+        assert silence_ids == ["a"]
+    assert client.requests[-1] == ("DELETE", "/api/v1/silence/a")
+
+
+def test_get_silence_uses_api_version():
+    client = FakeAlertManagerClient(api_version="v2")
+    client.get_silence("a")
+    assert client.requests[-1] == ("GET", "/api/v2/silence/a")
+
+
+def test_expire_failures_are_logged_once(caplog):
+    client = FakeAlertManagerClient(fail_create=("c",), fail_delete=True)
+    with pytest.raises(IOError):
+        client.add_silences([{"name": "a"}, {"name": "b"}, {"name": "c"}])
+    messages = [record.getMessage() for record in caplog.records
+                if record.levelname == "ERROR"]
+    assert sorted(messages) == [
+        "Failed to expire silence a: Can't expire silence",
+        "Failed to expire silence b: Can't expire silence"]
+
+
+def test_expire_silences_raises_after_trying_all():
+    client = FakeAlertManagerClient(fail_delete=True)
+    with pytest.raises(IOError):
+        client.expire_silences(["a", "b"])
+    assert sorted(url for method, url in client.requests
+                  if method == "DELETE") == [
+        "/api/v1/silence/a", "/api/v1/silence/b"]
@@ -0,0 +1,126 @@
+import os
+import re
+
+import pytest
+
+from stacklight_tests.clients.prometheus import exposition
+from stacklight_tests.clients.prometheus import prometheus_metric
+
+
+def read_fixture(name):
+    path = os.path.join(os.path.dirname(__file__), "fixtures", name)
+    with open(path) as f:
+        return f.read()
+
+
+def legacy_parse_raw(lines):
+    """PrometheusMetricClient.parse_raw before the exposition module."""
+    metric_line_regex = (r'(?P<metric_name>[\w\d_]+)'
+                         r'({(?P<metric_meta>.*)})* '
+                         r'(?P<metric_value>.*)')
+    metric_meta_regex = r'(?P<meta_name>\w*)="(?P<meta_value>[\w\d\_\-]*)"'
+    metrics = []
+    for line in lines:
+        if line[0] == "#":
+            continue
+        result = re.match(metric_line_regex, line)
+        metric = {
+            "name": result.group("metric_name"),
+            "value": result.group("metric_value"),
+            "meta": None,
+        }
+        meta = result.group("metric_meta")
+        if meta is not None:
+            metric["meta"] = dict(re.findall(metric_meta_regex, meta))
+        metrics.append(metric)
+    return metrics
+
+
+@pytest.mark.parametrize("line,expected", [
+    ("up 1", ("up", None, "1", None)),
+    ("up 1 1500000000000", ("up", None, "1", "1500000000000")),
+    ("ns:up:rate5m{} NaN", ("ns:up:rate5m", {}, "NaN", None)),
+    ('up{job="a",instance="b:9100",} 1',
+     ("up", {"job": "a", "instance": "b:9100"}, "1", None)),
+    ('up { job = "a" } +Inf -15', ("up", {"job": "a"}, "+Inf", "-15")),
+    # Braces, commas and equal signs inside of values, fast path
+    ('x{a="{b},c=d}"} 2 15', ("x", {"a": "{b},c=d}"}, "2", "15")),
+    # Escaped quotes, backslashes and new lines
+    (r'x{a="say \"hi\"",b="C:\\dir",c="1\n2",d="}"} 3',
+     ("x", {"a": 'say "hi"', "b": "C:\\dir", "c": "1\n2", "d": "}"},
+      "3", None)),
+])
+def test_parse_sample_line(line, expected):
+    assert exposition.parse_sample_line(line) == expected
+
+
+@pytest.mark.parametrize("line", [
+    "up", "up 1 2 3", 'up{job="a" 1', 'up{job="a\\"} 1', 'up{job} 1',
+    'up{job, a="b"} 1', 'up{job="a"}'])
+def test_parse_sample_line_errors(line):
+    with pytest.raises(ValueError):
+        exposition.parse_sample_line(line)
+
+
+def test_iter_samples():
+    lines = exposition.iter_lines(
+        [b'# HELP up Is up.\nup{job="a"} 1 15', b'00\n\n  \nup 0\n'])
+    samples = [(s.name, s.labels, s.value, s.timestamp)
+               for s in exposition.iter_samples(lines)]
+    assert samples == [("up", {"job": "a"}, 1.0, 1500),
+                       ("up", {}, 0.0, None)]
+
+
+def test_iter_families():
+    lines = read_fixture("metrics.prom").splitlines()
+    families = {family.name: family
+                for family in exposition.iter_families(lines)}
+    assert len(families) == 10
+    summary = families["go_gc_duration_seconds"]
+    assert summary.type == "summary"
+    assert summary.help == "A summary of the GC invocation durations."
+    assert [s.name for s in summary.samples][-2:] == [
+        "go_gc_duration_seconds_sum", "go_gc_duration_seconds_count"]
+    assert len(summary.samples) == 7
+    histogram = families[
+        "prometheus_local_storage_maintain_series_duration_seconds"]
+    assert histogram.type == "histogram"
+    assert len(histogram.samples) == 5
+    assert histogram.samples[2].labels["le"] == "+Inf"
+    assert len(families["node_cpu"].samples) == 6
+
+
+def test_iter_families_untyped_and_help_escapes():
+    lines = [
+        "# HELP a Line\\nbreak and \\\\ slash",
+        "a 1",
+        # Suffixes of untyped families are separate families
+        "a_count 2",
+        "b_sum 3",
+        "b_count 4",
+    ]
+    families = list(exposition.iter_families(lines))
+    assert [(f.name, f.type, len(f.samples)) for f in families] == [
+        ("a", "untyped", 1), ("a_count", "untyped", 1),
+        ("b_sum", "untyped", 1), ("b_count", "untyped", 1)]
+    assert families[0].help == "Line\nbreak and \\ slash"
+
+
+def test_parse_raw_matches_legacy_parser():
+    lines = read_fixture("metrics.prom").splitlines()
+    metrics = prometheus_metric.PrometheusMetricClient.parse_raw(lines)
+    legacy = legacy_parse_raw(lines)
+    assert len(metrics) == len(legacy)
+    for metric, legacy_metric in zip(metrics, legacy):
+        assert metric["name"] == legacy_metric["name"]
+        assert metric["value"] == legacy_metric["value"]
+        if legacy_metric["meta"] is None:
+            assert metric["meta"] is None
+            continue
+        # The legacy parser dropped values with characters other than
+        # alphanumerics, "_" and "-", e.g. paths and versions
+        assert all(metric["meta"][name] == value
+                   for name, value in legacy_metric["meta"].items())
+        dropped = set(metric["meta"]) - set(legacy_metric["meta"])
+        assert all(re.search(r"[^\w-]", metric["meta"][name])
+                   for name in dropped)
@@ -0,0 +1,171 @@
+import itertools
+import time
+
+import pytest
+
+from stacklight_tests.clients import grafana_templates_builder as builder
+from stacklight_tests.clients.prometheus import query_cache
+
+
+def make_groups(*sizes):
+    return {"$t{}".format(n): ["v{}".format(i) for i in range(size)]
+            for n, size in enumerate(sizes)}
+
+
+def as_tuples(templates):
+    return [tuple(sorted(template.items())) for template in templates]
+
+
+def test_iter_product():
+    templates = list(builder.iter_combinations(make_groups(2, 3)))
+    assert len(set(as_tuples(templates))) == 6
+
+
+@pytest.mark.parametrize("sizes", [(3, 1, 2), (2, 5), (4,)])
+def test_iter_each_value_uses_every_value(sizes):
+    groups = make_groups(*sizes)
+    templates = list(builder.iter_combinations(groups, "each"))
+    assert len(templates) == max(sizes)
+    for name, values in groups.items():
+        assert {template[name] for template in templates} == set(values)
+
+
+def test_iter_each_value_of_empty_template():
+    assert list(builder.iter_combinations(make_groups(3, 0), "each")) == []
+
+
+@pytest.mark.parametrize("sizes", [(2, 2, 2), (3, 4, 2, 5), (5, 1, 3, 3, 2)])
+def test_iter_pairwise_covers_all_pairs(sizes):
+    groups = make_groups(*sizes)
+    templates = list(builder.iter_combinations(groups, "pairwise"))
+    for first, second in itertools.combinations(sorted(groups), 2):
+        covered = {(template[first], template[second])
+                   for template in templates}
+        assert covered == set(itertools.product(groups[first],
+                                                groups[second]))
+    total = 1
+    for size in sizes:
+        total *= size
+    assert len(templates) < total
+
+
+def test_iter_pairwise_of_two_templates_is_product():
+    templates = builder.iter_combinations(make_groups(3, 2), "pairwise")
+    assert len(set(as_tuples(templates))) == 6
+
+
+def test_iter_random_is_reproducible():
+    groups = make_groups(5, 6, 7)
+
+    def sample(seed):
+        return as_tuples(builder.iter_combinations(
+            groups, "random", sample_size=20, seed=seed))
+
+    assert sample(1) == sample(1)
+    assert sample(1) != sample(2)
+    assert len(set(sample(1))) == 20
+    for template in sample(1):
+        for name, value in template:
+            assert value in groups[name]
+
+
+def test_iter_random_of_small_product():
+    templates = builder.iter_combinations(
+        make_groups(2, 3), "random", sample_size=20)
+    assert len(set(as_tuples(templates))) == 6
+
+
+class FakeDatasource(object):
+    queries = {
+        "$env": ("envs()", None),
+        "$server": ("servers($env)", None),
+        "$peer": ("peers($env, $server)", None),
+        "$volume": ("volumes($server)", "/.*/"),
+    }
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.calls = []
+
+    @staticmethod
+    def compile_query(query, replaces):
+        for pattern, value in replaces.items():
+            query = query.replace(pattern, value)
+        return query
+
+    def do_query(self, query, regex=None):
+        self.calls.append(query)
+        if self.delay:
+            # Make concurrent queries complete in different order
+            time.sleep(self.delay * (hash(query) % 5))
+        if query.startswith("servers"):
+            return ["s1", "s2", "s3"]
+        return ["{}:{}".format(query, n) for n in range(2)]
+
+
+def build_tree(datasource, **kwargs):
+    return builder.TemplatesTree(
+        datasource.queries, datasource, strategy="product", **kwargs)
+
+
+def get_all_templates(tree):
+    return sorted(
+        tuple(sorted(node.get_full_template().items()))
+        for nodes in tree.nodes_by_level.values() for node in nodes)
+
+
+def test_tree_built_concurrently_equals_sequential():
+    sequential = build_tree(FakeDatasource(), max_workers=1)
+    concurrent = build_tree(FakeDatasource(delay=0.001), max_workers=8)
+    assert get_all_templates(concurrent) == get_all_templates(sequential)
+    assert len(list(sequential.get_nodes_by_name("$peer"))) == 12
+    query = "rate(x{peer=\"$peer\", volume=\"$volume\"}[5m])"
+    assert (
+        sorted(as_tuples(concurrent.get_all_templates_for_query(query))) ==
+        sorted(as_tuples(sequential.get_all_templates_for_query(query))))
+
+
+def test_tree_build_raises_query_error():
+    datasource = FakeDatasource()
+
+    def do_query(query, regex=None):
+        if query.startswith("peers"):
+            raise IOError("Can't query")
+        return ["s1"]
+
+    datasource.do_query = do_query
+    with pytest.raises(IOError):
+        build_tree(datasource, max_workers=4)
+
+
+def test_tree_skips_template_without_values():
+    datasource = FakeDatasource()
+
+    def do_query(query, regex=None):
+        if query.startswith("peers"):
+            raise KeyError("No data")
+        return ["s1"]
+
+    datasource.do_query = do_query
+    tree = build_tree(datasource)
+    assert list(tree.get_nodes_by_name("$peer")) == []
+    assert len(list(tree.get_nodes_by_name("$volume"))) == 1
+
+
+def test_tree_runs_every_compiled_query_once():
+    datasource = FakeDatasource()
+    build_tree(datasource, max_workers=4)
+    # Volumes depend only on the server, so both environments share them
+    assert sorted(query for query in datasource.calls
+                  if query.startswith("volumes(s")) == [
+        "volumes(s1)", "volumes(s2)", "volumes(s3)"]
+    assert len(datasource.calls) == len(set(datasource.calls))
+
+
+def test_trees_share_values_store():
+    store = query_cache.ValuesStore()
+    first, second = FakeDatasource(), FakeDatasource()
+    build_tree(first, values_store=store)
+    build_tree(second, values_store=store)
+    assert first.calls
+    assert second.calls == []
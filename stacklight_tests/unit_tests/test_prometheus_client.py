@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+from stacklight_tests.clients.prometheus import prometheus_client
+
+
+def split(body, size):
+    return [body[n:n + size] for n in range(0, len(body), size)]
+
+
+def make_body(result_type, result):
+    return json.dumps({"status": "success",
+                       "data": {"resultType": result_type,
+                                "result": result}})
+
+
+vector = [
+    {"metric": {"__name__": "up", "host": u"ctl01 – ü"},
+     "value": [1500000000.5, "1"]},
+    {"metric": {"__name__": "up", "job": "a,b]}{"},
+     "value": [1500000000.5, "0"]},
+]
+
+
+@pytest.mark.parametrize("result_type,result", [
+    ("vector", vector),
+    ("vector", []),
+    ("matrix", [{"metric": {}, "values": [[1, "1"], [2, "2"]]}]),
+    ("scalar", [1500000000.5, "1"]),
+    ("string", [1500000000.5, "some ] text"]),
+])
+def test_iter_query_result(result_type, result):
+    body = make_body(result_type, result)
+    # Every chunk size splits tokens and multibyte characters differently
+    for size in range(1, len(body) + 1):
+        items = list(prometheus_client.iter_query_result(split(body, size)))
+        assert items == json.loads(body)["data"]["result"]
+
+
+def test_iter_query_result_reports_error():
+    body = json.dumps({"status": "error", "errorType": "bad_data",
+                       "error": "parse error at char 5"})
+    for size in (1, 7, len(body)):
+        with pytest.raises(Exception) as e:
+            list(prometheus_client.iter_query_result(split(body, size)))
+        assert "bad_data: parse error at char 5" in str(e.value)
+
+
+def test_iter_query_result_truncated():
+    body = make_body("vector", vector)[:-30]
+    with pytest.raises(ValueError):
+        list(prometheus_client.iter_query_result(split(body, 16)))
+
+
+@pytest.fixture
+def measurements_index():
+    return prometheus_client.MeasurementsIndex(
+        ["up", "node_load1", "node_load15", "ns:cpu:rate5m",
+         "node_cpu_seconds_total"])
+
+
+@pytest.mark.parametrize("query,expected", [
+    ("up", ["up"]),
+    # Longer names which start with a known one are different names
+    ("node_load15 > node_load1", ["node_load15", "node_load1"]),
+    ("node_load1 + node_load1 * 2", ["node_load1"]),
+    ('sum(rate(node_cpu_seconds_total{mode!="idle"}[5m])) by (host)',
+     ["node_cpu_seconds_total"]),
+    ("ns:cpu:rate5m / on(host) up", ["ns:cpu:rate5m", "up"]),
+    ("unknown_metric{job=\"up\"} or upper", []),
+    ("", []),
+])
+def test_measurements_index(measurements_index, query, expected):
+    assert measurements_index.find_all(query) == expected
+
+
+def test_measurements_index_parse_measurement(monkeypatch):
+    client = prometheus_client.PrometheusClient("http://prometheus")
+    monkeypatch.setattr(client, "get_label_values",
+                        lambda name: ["up", "ALERTS", "node_load1"])
+    assert client.parse_measurements("ALERTS or node_load1 or up") == [
+        "node_load1", "up"]
+    assert client.parse_measurement("node_load1 > 1") == "node_load1"
+    assert client.parse_measurement("1") is None
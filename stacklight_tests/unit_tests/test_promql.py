@@ -0,0 +1,278 @@
+import pytest
+
+from stacklight_tests.clients.prometheus import promql
+from stacklight_tests.clients.prometheus import series
+
+
+def make_series(labels, start, end, step, func):
+    timestamps = range(start, end + 1, step)
+    return series.RangeSeries(labels, timestamps,
+                              [func(ts) for ts in timestamps])
+
+
+@pytest.fixture
+def evaluator():
+    snapshot = [
+        make_series({"__name__": "requests_total", "host": "a", "job": "x"},
+                    0, 3600, 15, lambda ts: ts * 2.0),
+        make_series({"__name__": "requests_total", "host": "b", "job": "x"},
+                    0, 3600, 15, lambda ts: ts * 1.0),
+        make_series({"__name__": "up", "host": "a", "job": "x"},
+                    0, 3600, 15, lambda ts: 1.0),
+        make_series({"__name__": "up", "host": "b", "job": "x"},
+                    0, 3600, 15, lambda ts: 0.0 if ts > 1800 else 1.0),
+        make_series({"__name__": "disk_free", "host": "a"},
+                    0, 3600, 15, lambda ts: 1000.0 - ts * 0.2),
+        make_series({"__name__": "capacity", "job": "x"},
+                    0, 3600, 15, lambda ts: 10.0),
+    ]
+    return promql.Evaluator(snapshot)
+
+
+def as_dict(vector):
+    return {tuple(sorted(labels.items())): value for labels, value in vector}
+
+
+class FakeClient(object):
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.requests = []
+
+    def get_query(self, query, timestamp=None, cached=True):
+        matrix = promql.parse(query)
+        start = timestamp - matrix.range
+        self.requests.append((promql.format_selector(matrix.vector), start,
+                              timestamp))
+        evaluator = promql.Evaluator(self.snapshot)
+        result = []
+        for item in evaluator._select(matrix.vector):
+            result.append({
+                "metric": item.labels,
+                "values": [[ts, str(value)] for ts, value in
+                           zip(item.timestamps, item.values)
+                           if start < ts <= timestamp]})
+        return result
+
+
+@pytest.mark.parametrize("query,expected", [
+    ('up{job="x"}[5m]',
+     [("ident", "up"), ("op", "{"), ("ident", "job"), ("op", "="),
+      ("string", '"x"'), ("op", "}"), ("op", "["), ("duration", "5m"),
+      ("op", "]")]),
+    ("a >= bool 1.5e3 # comment",
+     [("ident", "a"), ("op", ">="), ("ident", "bool"), ("number", "1.5e3")]),
+    ("x offset 1h30m", [("ident", "x"), ("ident", "offset"),
+                        ("duration", "1h30m")]),
+])
+def test_tokenize(query, expected):
+    assert [(t.type, t.value) for t in promql.tokenize(query)] == expected
+
+
+def test_tokenize_error():
+    with pytest.raises(promql.PromQLError):
+        promql.tokenize("up @ 1")
+
+
+def test_parse_duration():
+    assert promql.parse_duration("1h30m") == 5400
+    assert promql.parse_duration("2d") == 2 * 24 * 60 * 60
+
+
+def test_parse_selectors():
+    node = promql.parse('rate(x{a=~"b.*",c!="d"}[5m] offset 1m)')
+    assert isinstance(node, promql.Call)
+    matrix = node.args[0]
+    assert matrix.range == 300
+    assert matrix.vector.offset == 60
+    assert matrix.vector.matchers == [
+        promql.Matcher("__name__", "=", "x"),
+        promql.Matcher("a", "=~", "b.*"),
+        promql.Matcher("c", "!=", "d")]
+
+
+def test_parse_precedence():
+    node = promql.parse("a + b * c > bool 1 and d")
+    assert node.op == "and"
+    assert node.lhs.op == ">"
+    assert node.lhs.return_bool
+    assert node.lhs.lhs.op == "+"
+    assert node.lhs.lhs.rhs.op == "*"
+
+
+def test_parse_aggregation_grouping():
+    for query in ("sum by (host) (x)", "sum(x) by (host)"):
+        node = promql.parse(query)
+        assert node.op == "sum"
+        assert node.grouping == ("host",)
+        assert not node.without
+
+
+def test_parse_vector_matching():
+    node = promql.parse("a / ignoring (b) group_left (c) d")
+    assert node.matching == "ignoring"
+    assert node.on == ("b",)
+    assert node.group_side == "group_left"
+    assert node.include == ("c",)
+
+
+def test_parse_keywords_case_insensitive():
+    node = promql.parse(
+        "SUM BY (Host) (x OFFSET 1m) > BOOL 0 AND ON (Host) y")
+    assert node.op == "and"
+    assert node.on == ("Host",)
+    assert node.lhs.return_bool
+    aggregation = node.lhs.lhs
+    assert aggregation.op == "sum"
+    assert aggregation.grouping == ("Host",)
+    assert aggregation.expr.offset == 60
+
+
+def test_parse_negative_offset():
+    node = promql.parse("rate(x[5m] offset -1m)")
+    assert node.args[0].vector.offset == -60
+
+
+@pytest.mark.parametrize("query", ["sum(", "x[5m", "rate(x[5m]) +", "(1"])
+def test_parse_errors(query):
+    with pytest.raises(promql.PromQLError):
+        promql.parse(query)
+
+
+def test_get_metric_names():
+    node = promql.parse(
+        'sum(rate(a[5m])) by (host) / on (host) group_left b{c="d"} > 0 '
+        'and {__name__="z"} unless absent(offset_total offset 5m)')
+    assert promql.get_metric_names(node) == {"a", "b", "z", "offset_total"}
+
+
+def test_format_selector():
+    node = promql.parse('foo{a="b\\"c",d=~"x"}')
+    assert promql.format_selector(node) == 'foo{a="b\\"c",d=~"x"}'
+
+
+def test_rate(evaluator):
+    result = as_dict(evaluator.evaluate("rate(requests_total[5m])", 3000))
+    assert result == {(("host", "a"), ("job", "x")): 2.0,
+                      (("host", "b"), ("job", "x")): 1.0}
+
+
+def test_increase_and_irate(evaluator):
+    increase = as_dict(evaluator.evaluate(
+        'increase(requests_total{host="b"}[1m])', 3000))
+    assert increase.values() == [60.0]
+    irate = as_dict(evaluator.evaluate(
+        'irate(requests_total{host=~"a|c"}[5m])', 3000))
+    assert irate.values() == [2.0]
+
+
+def test_over_time(evaluator):
+    result = as_dict(evaluator.evaluate("count_over_time(up[10m])", 3000))
+    assert set(result.values()) == {40.0}
+    result = evaluator.evaluate('max_over_time(up{host="b"}[10m])', 3000)
+    assert [value for _, value in result] == [0.0]
+
+
+def test_predict_linear(evaluator):
+    result = evaluator.evaluate(
+        "predict_linear(disk_free[1h], 3600) < 0", 3000)
+    assert [value for _, value in result] == [pytest.approx(-320.0)]
+
+
+def test_aggregations(evaluator):
+    result = evaluator.evaluate(
+        "sum by (job) (rate(requests_total[5m]))", 3000)
+    assert result == [({"job": "x"}, 3.0)]
+    result = evaluator.evaluate(
+        "sum(rate(requests_total[5m])) without (host)", 3000)
+    assert result == [({"job": "x"}, 3.0)]
+    result = evaluator.evaluate("topk(1, requests_total)", 3000)
+    assert [labels["host"] for labels, _ in result] == ["a"]
+
+
+def test_comparison_filters_and_bool(evaluator):
+    result = evaluator.evaluate("up == 0", 3000)
+    assert result == [({"__name__": "up", "host": "b", "job": "x"}, 0.0)]
+    result = as_dict(evaluator.evaluate("up == bool 0", 3000))
+    assert sorted(result.values()) == [0.0, 1.0]
+
+
+def test_vector_matching(evaluator):
+    result = as_dict(evaluator.evaluate(
+        "rate(requests_total[5m]) / on (job) group_left capacity", 3000))
+    assert result == {(("host", "a"), ("job", "x")): 0.2,
+                      (("host", "b"), ("job", "x")): 0.1}
+    result = as_dict(evaluator.evaluate(
+        "up * on (host) rate(requests_total[5m])", 3000))
+    assert result == {(("host", "a"),): 2.0, (("host", "b"),): 0.0}
+
+
+def test_set_operators(evaluator):
+    result = evaluator.evaluate("up unless up == 0", 3000)
+    assert [labels["host"] for labels, _ in result] == ["a"]
+    result = evaluator.evaluate("up and on (host) (up == 0)", 3000)
+    assert [labels["host"] for labels, _ in result] == ["b"]
+
+
+def test_scalars(evaluator):
+    assert evaluator.evaluate("-2 ^ 2", 0) == -4.0
+    assert evaluator.evaluate("1 + 2 * 3 > bool 6", 0) == 1.0
+    assert evaluator.evaluate("time()", 42) == 42.0
+    with pytest.raises(promql.PromQLError):
+        evaluator.evaluate("1 > 2", 0)
+
+
+def test_absent(evaluator):
+    assert evaluator.evaluate('absent(missing{job="y"})', 3000) == [
+        ({"job": "y"}, 1.0)]
+    assert evaluator.evaluate("absent(up)", 3000) == []
+
+
+def test_lookback(evaluator):
+    assert len(evaluator.evaluate("up", 3600 + 299)) == 2
+    assert evaluator.evaluate("up", 3600 + 300) == []
+
+
+def test_evaluate_alert(evaluator):
+    activations = evaluator.evaluate_alert(
+        "up == 0", 0, 3500, 60, for_duration=300)
+    assert len(activations) == 1
+    activation = activations[0]
+    assert activation.labels["host"] == "b"
+    assert activation.active_at == 1860
+    assert activation.fired_at == 2160
+    assert activation.resolved_at is None
+
+
+def test_capture_snapshot_fetches_whole_range():
+    source = [make_series({"__name__": "x"}, 0, 10000, 15,
+                          lambda ts: ts * 1.0)]
+    client = FakeClient(source)
+    snapshot = promql.capture_snapshot(
+        client, "rate(x[1h]) > 0", 10000, 10000)
+    assert client.requests == [("x{}", 6400, 10000)]
+    result = promql.Evaluator(snapshot).evaluate("count_over_time(x[1h])",
+                                                 10000)
+    assert [value for _, value in result] == [240.0]
+
+
+def test_capture_snapshot_keeps_raw_samples():
+    # Series disappears at 4980, it's absent for the evaluator after one
+    # lookback like in Prometheus, and not after two of them
+    source = [make_series({"__name__": "x"}, 0, 4980, 60,
+                          lambda ts: 1.0)]
+    snapshot = promql.capture_snapshot(
+        FakeClient(source), "absent(x)", 5000, 6000)
+    assert list(snapshot[0].timestamps)[-2:] == [4920, 4980]
+    evaluator = promql.Evaluator(snapshot)
+    assert evaluator.evaluate("absent(x)", 4980 + 299) == []
+    assert len(evaluator.evaluate("absent(x)", 4980 + 300)) == 1
+
+
+def test_capture_snapshot_merges_windows():
+    source = [make_series({"__name__": "x", "a": "b"}, 0, 10000, 15,
+                          lambda ts: 1.0)]
+    client = FakeClient(source)
+    promql.capture_snapshot(
+        client, 'x{a="b"} > 0 and max_over_time(x{a="b"}[10m] offset 1h)',
+        9000, 10000)
+    assert client.requests == [('x{a="b"}', 9000 - 3600 - 600, 10000)]
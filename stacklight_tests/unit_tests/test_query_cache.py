@@ -0,0 +1,116 @@
+import pytest
+import requests
+
+from stacklight_tests.clients.prometheus import query_cache
+
+
+class Calls(object):
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.count = 0
+
+    def __call__(self):
+        self.count += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture
+def now(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(query_cache.time, "time", lambda: now[0])
+    return now
+
+
+def test_query_cache_expires_by_time_bucket(now):
+    cache = query_cache.QueryCache(ttl=60)
+    cache.put("up", [1])
+    now[0] = 1019.9
+    assert cache.get("up") == [1]
+    # Entry is 20s old only, but the next bucket has started
+    now[0] = 1020.0
+    assert cache.get("up") is None
+    assert len(cache) == 0
+    assert cache.stats == {"hits": 1, "misses": 1, "size": 0}
+
+
+def test_query_cache_evicts_least_recently_used(now):
+    cache = query_cache.QueryCache(ttl=60, max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_query_cache_put_replaces_entry(now):
+    cache = query_cache.QueryCache(ttl=60, max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.put("a", 3)
+    cache.put("c", 4)
+    assert cache.get("a") == 3
+    assert cache.get("b") is None
+
+
+def test_query_cache_get_or_call(now):
+    cache = query_cache.QueryCache(ttl=60)
+    func = Calls([1], [2])
+    assert cache.get_or_call("up", func) == [1]
+    assert cache.get_or_call("up", func) == [1]
+    now[0] += 60
+    assert cache.get_or_call("up", func) == [2]
+    assert func.count == 2
+
+
+def test_query_cache_results_are_copies(now):
+    cache = query_cache.QueryCache(ttl=60)
+    value = [{"metric": {"job": "a"}}]
+    cache.put("up", value)
+    value.append("stored")
+    result = cache.get("up")
+    result[0]["metric"]["job"] = "b"
+    result.append("returned")
+    assert cache.get("up") == [{"metric": {"job": "a"}}]
+
+
+def test_query_store_keeps_only_outcome():
+    store = query_cache.QueryStore()
+    func = Calls([{"metric": {}, "value": [0, "1"]}])
+    assert store.check("up", func) is True
+    assert store.check("  up ", func) is True
+    assert func.count == 1
+    assert store.stats["dedupe_ratio"] == 2.0
+
+
+@pytest.mark.parametrize("outcome", [[], ValueError("bad query")])
+def test_query_store_memoizes_failures(outcome):
+    store = query_cache.QueryStore()
+    func = Calls(outcome)
+    message = store.check("up", func)
+    assert message is not True
+    assert store.check("up", func) == message
+    assert func.count == 1
+
+
+def test_query_store_doesnt_store_transient_errors():
+    store = query_cache.QueryStore()
+    func = Calls(requests.ConnectionError("refused"), [1])
+    with pytest.raises(requests.ConnectionError):
+        store.check("up", func)
+    assert len(store) == 0
+    assert store.check("up", func) is True
+    assert func.count == 2
+
+
+def test_values_store():
+    store = query_cache.ValuesStore()
+    func = Calls(["a"], ["b"])
+    assert store.get_or_call("x", func, variant="/a/") == ["a"]
+    assert store.get_or_call("x", func, variant="/a/") == ["a"]
+    assert store.get_or_call("x", func, variant="/b/") == ["b"]
+    assert func.count == 2
@@ -0,0 +1,38 @@
+from stacklight_tests.clients.prometheus import rule_coverage
+
+
+def test_metrics_of_selectors_only():
+    coverage = rule_coverage.AlertRulesCoverage({
+        "CpuHigh": 'avg by (host) (rate(cpu_usage{job="node"}[5m])) > 0.9 '
+                   'and on (host) up == 1',
+        "NoData": 'absent({__name__="procstat_running"}) UNLESS '
+                  'COUNT WITHOUT (instance) (x offset -5m) > bool 0',
+    })
+    assert coverage.metrics_by_rule == {
+        "CpuHigh": {"cpu_usage", "up"},
+        "NoData": {"procstat_running", "x"},
+    }
+    assert coverage.get_missing(["cpu_usage", "up", "x"]) == {
+        "NoData": ["procstat_running"]}
+
+
+def test_unparsable_expressions_are_reported():
+    coverage = rule_coverage.AlertRulesCoverage({
+        "Broken": "rate(x[5m]",
+        "Subquery": "max_over_time(rate(y[5m])[1h:1m]) > 0",
+        "Valid": "x > 0",
+    })
+    assert list(coverage.errors) == ["Broken", "Subquery"]
+    assert coverage.metric_names == {"x"}
+
+
+def test_from_grains():
+    grains = {
+        "mon01": {"A": {"if": "a > 0"}, "Skipped": {"if": "s > 0"}},
+        "mon02": {"A": {"if": "a > 0"}, "B": {"if": "b > 0"}},
+        "mon03": None,
+    }
+    coverage = rule_coverage.AlertRulesCoverage.from_grains(
+        grains, exclude=["Skip"])
+    assert list(coverage.metrics_by_rule) == ["A", "B"]
+    assert len(coverage) == 2
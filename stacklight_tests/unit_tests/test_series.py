@@ -0,0 +1,103 @@
+import pytest
+
+from stacklight_tests.clients.prometheus import series
+
+
+def make_series(values, step=10.0, start=100.0, labels=None):
+    return series.RangeSeries(
+        labels or {"__name__": "requests_total"},
+        [start + n * step for n in range(len(values))], values)
+
+
+def test_from_json():
+    item = series.RangeSeries.from_json({
+        "metric": {"__name__": "up", "job": "a"},
+        "values": [[100, "1"], [110.5, "0"], [120, "NaN"]]})
+    assert item.name == "up"
+    assert len(item) == 3
+    assert list(item.timestamps) == [100.0, 110.5, 120.0]
+    assert list(item.values)[:2] == [1.0, 0.0]
+    assert item.duration == 20.0
+
+
+@pytest.mark.parametrize("values,expected", [
+    ([], 0.0),
+    ([5], 0.0),
+    ([1, 3, 6], 5.0),
+    # Counter reset: counts from zero up to 4 after the drop
+    ([10, 12, 4, 7], 2.0 + 4 + 3),
+    # Reset to exactly zero and several resets in a row
+    ([3, 0, 2, 1, 1], 0.0 + 2 + 1 + 0),
+])
+def test_increase(values, expected):
+    assert make_series(values).increase() == expected
+
+
+def test_rate():
+    assert make_series([10, 12, 4, 7]).rate() == 9.0 / 30
+    assert make_series([7]).rate() == 0.0
+    assert make_series([]).rate() == 0.0
+
+
+def test_get_gaps():
+    item = series.RangeSeries(
+        {}, [0, 10, 20, 50, 60, 61, 100], [0] * 7)
+    assert item.get_gaps(15) == [(20, 50), (61, 100)]
+    # Interval equal to max_interval is not a gap
+    assert item.get_gaps(40) == []
+    assert make_series([1]).get_gaps(1) == []
+
+
+def test_slope():
+    assert make_series([1, 3, 5, 7]).slope() == pytest.approx(0.2)
+    assert make_series([4, 4, 4]).slope() == 0.0
+    assert make_series([4]).slope() == 0.0
+
+
+@pytest.fixture
+def intern_tables(monkeypatch):
+    monkeypatch.setattr(series, "_interned_strings", {})
+    monkeypatch.setattr(series, "_interned_label_sets", {})
+    return series
+
+
+def test_label_set_intern_shares_equal_sets(intern_tables):
+    first = series.LabelSet.intern({"__name__": "up", "job": "a"})
+    second = series.LabelSet.intern({"job": "a", "__name__": "up"})
+    other = series.LabelSet.intern({"__name__": "up", "job": "b"})
+    assert first is second
+    assert first != other
+    assert first == (("__name__", "up"), ("job", "a"))
+    # Strings are shared between different label sets too
+    assert other[0][0] is first[0][0]
+    assert len(intern_tables._interned_label_sets) == 2
+
+
+def test_label_set_accessors(intern_tables):
+    labels = series.LabelSet.intern({"__name__": "up", "job": "a"})
+    assert labels.name == "up"
+    assert labels.get("job") == "a"
+    assert labels.get("host", "-") == "-"
+    assert labels.to_dict() == {"__name__": "up", "job": "a"}
+    assert series.LabelSet.intern({}).name is None
+    assert hash(labels) == hash(series.LabelSet.intern(labels.to_dict()))
+
+
+def test_intern_tables_are_bounded(intern_tables, monkeypatch):
+    monkeypatch.setattr(series, "MAX_INTERNED", 2)
+    for n in range(5):
+        series.LabelSet.intern({"n": str(n)})
+    assert len(intern_tables._interned_label_sets) <= 3
+    assert len(intern_tables._interned_strings) <= 3
+    labels = series.LabelSet.intern({"n": "4"})
+    assert labels == (("n", "4"),)
+
+
+def test_sample_from_json(intern_tables):
+    sample = series.Sample.from_json(
+        {"metric": {"__name__": "up", "job": "a"}, "value": [100.5, "1"]})
+    assert sample.name == "up"
+    assert sample.timestamp == 100.5
+    assert sample.value == 1.0
+    assert sample.labels is series.LabelSet.intern(
+        {"__name__": "up", "job": "a"})
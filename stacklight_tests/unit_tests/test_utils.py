@@ -0,0 +1,162 @@
+import datetime as dt
+
+import pytest
+
+from stacklight_tests.clients.prometheus import prometheus_client
+from stacklight_tests import custom_exceptions as exceptions
+from stacklight_tests import utils
+
+
+@pytest.mark.parametrize("timestamp,expected", [
+    ("2019-01-01T10:00:00Z", dt.datetime(2019, 1, 1, 10)),
+    ("2019-01-01t10:00:00.5z", dt.datetime(2019, 1, 1, 10, 0, 0, 500000)),
+    ("2019-01-01 10:00:00.123456Z",
+     dt.datetime(2019, 1, 1, 10, 0, 0, 123456)),
+    # Nanoseconds of Alertmanager are truncated, not rounded
+    ("2019-01-01T10:00:00.123456789Z",
+     dt.datetime(2019, 1, 1, 10, 0, 0, 123456)),
+    ("2019-01-01T10:00:00.999999999+00:00",
+     dt.datetime(2019, 1, 1, 10, 0, 0, 999999)),
+    ("2019-01-01T01:30:00+03:30", dt.datetime(2018, 12, 31, 22)),
+    ("2019-12-31T22:00:00-02:15", dt.datetime(2020, 1, 1, 0, 15)),
+    # Zero time of Go and offsets beyond supported dates
+    ("0001-01-01T00:00:00Z", dt.datetime(1, 1, 1)),
+    ("0001-01-01T00:00:00+01:00", dt.datetime.min),
+    ("9999-12-31T23:59:59-01:00", dt.datetime.max),
+])
+def test_parse_time_rfc_3339(timestamp, expected):
+    assert utils.parse_time_rfc_3339(timestamp) == expected
+
+
+@pytest.mark.parametrize("timestamp", [
+    "", "2019-01-01", "2019-01-01T10:00:00", "2019-01-01T10:00Z",
+    "2019-01-01T10:00:00.Z", "2019-01-01T10:00:00+0300",
+    "2019-01-01T10:00:00Z ", "2019-13-01T10:00:00Z",
+    "2019-02-30T10:00:00Z", "2019-01-01T25:00:00Z"])
+def test_parse_time_rfc_3339_malformed(timestamp):
+    with pytest.raises(ValueError):
+        utils.parse_time_rfc_3339(timestamp)
+
+
+class Clock(object):
+    """Fake time, which moves forward only on sleep."""
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        # Sleep of zero seconds still takes some time
+        self.now += max(seconds, 0.1)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(utils.time, "time", clock.time)
+    monkeypatch.setattr(utils.time, "sleep", clock.sleep)
+    return clock
+
+
+class ReadyAtWatcher(utils.ConditionsWatcher):
+    """Condition is satisfied when the clock reaches its time."""
+    def __init__(self, clock, interval=5, timeout=60):
+        super(ReadyAtWatcher, self).__init__(interval, timeout)
+        self.clock = clock
+        self.polls = 0
+
+    def _get_satisfied(self, pending):
+        self.polls += 1
+        return [key for key, ready_at in pending.items()
+                if ready_at <= self.clock.now]
+
+
+def test_conditions_watcher_satisfied(clock):
+    watcher = ReadyAtWatcher(clock)
+    watcher.add_condition("a", 1000)
+    watcher.add_condition("b", 1012)
+    assert watcher.wait() == {"a": 0.0, "b": 15.0}
+    assert not watcher.pending
+    assert watcher.poll()
+    # Satisfied conditions are not checked again
+    assert watcher.polls == 4
+
+
+def test_conditions_watcher_timeout(clock):
+    watcher = ReadyAtWatcher(clock, timeout=60)
+    watcher.add_condition("a", 1000)
+    watcher.add_condition("b", 2000)
+    with pytest.raises(exceptions.TimeoutError) as e:
+        watcher.wait(timeout_msg="Not ready")
+    assert str(e.value).startswith("Not ready. Pending conditions:\nb")
+    assert list(watcher.pending) == ["b"]
+    assert 1060 < clock.now < 1061
+
+
+def test_conditions_watcher_timeout_override(clock):
+    watcher = ReadyAtWatcher(clock, timeout=60)
+    watcher.add_condition("a", 1100)
+    assert watcher.wait(timeout=120) == {"a": 100.0}
+    watcher.add_condition("b", 2000)
+    with pytest.raises(exceptions.TimeoutError):
+        watcher.wait(timeout=10)
+    assert 1110 < clock.now < 1111
+    # The override doesn't change timeout of the watcher
+    assert watcher.timeout == 60
+
+
+def test_conditions_watcher_polls_companions(clock):
+    watcher = ReadyAtWatcher(clock)
+    watcher.add_condition("a", 1010)
+    companion = ReadyAtWatcher(clock)
+    companion.add_condition("c", 1005)
+    companion.add_condition("d", 5000)
+    watcher.wait(companions=[companion])
+    # Companion doesn't keep the wait going, but is checked on every tick
+    assert companion.polls == 3
+    assert list(companion.pending) == ["d"]
+
+
+class FakePrometheus(object):
+    def __init__(self, outputs):
+        self.outputs = outputs
+        self.batches = []
+
+    def get_queries(self, queries, cached=True):
+        self.batches.append(queries)
+        results = []
+        for query in queries:
+            output = self.outputs[query].pop(0)
+            if isinstance(output, Exception):
+                results.append(prometheus_client.QueryResult(
+                    query, None, output))
+            else:
+                results.append(prometheus_client.QueryResult(
+                    query, output, None))
+        return results
+
+
+def test_metric_values_watcher(clock):
+    client = FakePrometheus({
+        "up": [[{"value": [0, "1"]}]],
+        "x": [IOError("refused"), [], [{"value": [0, "0"]}],
+              [{"value": [0, "5"]}]],
+    })
+    watcher = prometheus_client.MetricValuesWatcher(client, interval=30)
+    watcher.add("up", 1)
+    watcher.add("x", 5)
+    satisfied_after = watcher.wait()
+    assert satisfied_after == {("up", "1"): 0.0, ("x", "5"): 90.0}
+    # Every tick sends pending queries only, as one batch
+    assert client.batches == [["up", "x"], ["x"], ["x"], ["x"]]
+
+
+def test_metric_values_watcher_timeout(clock):
+    client = FakePrometheus({"x": [[{"value": [0, "0"]}]] * 4})
+    watcher = prometheus_client.MetricValuesWatcher(
+        client, interval=30, timeout=60)
+    watcher.add("x", 5, msg="x is not 5")
+    with pytest.raises(exceptions.TimeoutError) as e:
+        watcher.wait()
+    assert "x is not 5" in str(e.value)
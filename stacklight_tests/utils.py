@@ -1,6 +1,9 @@
+import collections
 import datetime as dt
+from multiprocessing import pool as mp_pool
 import os
 import random
+import re
 import tempfile
 import time
 
@@ -9,6 +12,7 @@ from requests.packages.urllib3 import poolmanager
 import yaml
 
 from stacklight_tests import custom_exceptions as exceptions
+from stacklight_tests import settings
 
 
 class TestHTTPAdapter(requests.adapters.HTTPAdapter):
@@ -43,6 +47,109 @@ def wait(predicate, interval=5, timeout=60, timeout_msg="Waiting timed out"):
     return timeout + start_time - time.time()
 
 
+class ConditionsWatcher(object):
+    """Wait for many conditions at once.
+
+    All pending conditions are checked together on every tick, so the total
+    waiting time is the time of the slowest condition instead of the sum of
+    all waits. Subclasses implement check of all pending conditions in
+    _get_satisfied.
+    """
+    def __init__(self, interval=5, timeout=60):
+        self.interval = interval
+        self.timeout = timeout
+        self.conditions = collections.OrderedDict()
+        self.satisfied_after = {}
+
+    def add_condition(self, key, condition):
+        self.conditions[key] = condition
+        self.satisfied_after.pop(key, None)
+
+    @property
+    def pending(self):
+        return collections.OrderedDict(
+            (key, condition) for key, condition in self.conditions.items()
+            if key not in self.satisfied_after)
+
+    def _get_satisfied(self, pending):
+        """Return keys of satisfied conditions from pending dict."""
+        raise NotImplementedError
+
+    def _format_pending(self, pending):
+        return "\n".join(str(key) for key in pending)
+
+    def poll(self, start_time=None):
+        """Check pending conditions once.
+
+        :param start_time: time to count seconds spent on conditions from,
+         defaults to now
+        :returns: True if no conditions are pending
+        """
+        if start_time is None:
+            start_time = time.time()
+        pending = self.pending
+        if pending:
+            for key in self._get_satisfied(pending):
+                self.satisfied_after[key] = time.time() - start_time
+        return not self.pending
+
+    def wait(self, timeout_msg="Waiting timed out", timeout=None,
+             companions=()):
+        """Wait until all conditions are satisfied.
+
+        :param timeout: overrides timeout of the watcher for this wait
+        :param companions: other watchers polled on every tick, the wait
+         doesn't depend on their conditions
+        :returns: dict with count of seconds spent on every condition
+        :raises: TimeoutError with list of conditions, which are still
+         pending
+        """
+        start_time = time.time()
+        if timeout is None:
+            timeout = self.timeout
+
+        def check():
+            for companion in companions:
+                companion.poll()
+            return self.poll(start_time)
+
+        try:
+            wait(check, interval=self.interval, timeout=timeout)
+        except exceptions.TimeoutError:
+            raise exceptions.TimeoutError("{}. Pending conditions:\n{}".format(
+                timeout_msg, self._format_pending(self.pending)))
+        return dict(self.satisfied_after)
+
+
+def map_concurrently(func, items, max_workers=None):
+    """Apply func to every item using a bounded pool of threads.
+
+    :param func: callable to apply
+    :param items: iterable of arguments for func
+    :param max_workers: maximum number of threads in the pool
+    :returns: list of (result, error) tuples in the same order as items,
+     where error is the raised exception or None
+    """
+    def call(item):
+        try:
+            return func(item), None
+        except Exception as e:
+            return None, e
+
+    items = list(items)
+    if max_workers is None:
+        max_workers = settings.MAX_WORKERS
+    max_workers = min(max_workers, len(items))
+    if max_workers <= 1:
+        return [call(item) for item in items]
+    pool = mp_pool.ThreadPool(processes=max_workers)
+    try:
+        return pool.map(call, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
 def write_cert(cert_content):
     with tempfile.NamedTemporaryFile(
             prefix="ca_", suffix=".pem", delete=False) as f:
@@ -110,16 +217,35 @@ def check_http_get_response(url, expected_codes=(200,), msg=None, **kwargs):
     return response
 
 
+_rfc_3339_regex = re.compile(
+    r"(\d{4})-(\d\d)-(\d\d)[Tt ](\d\d):(\d\d):(\d\d)(?:\.(\d+))?"
+    r"(?:[Zz]|([+-])(\d\d):(\d\d))$")
+
+
 def parse_time_rfc_3339(timestamp):
-    dt_format = "%Y-%m-%dT%H:%M:%S.%fZ"
-    dt_fallback_format = "%Y-%m-%dT%H:%M:%SZ"
-    # zero_dt = dt.datetime.strptime("0001-01-01T00:00:00Z",
-    #                                dt_fallback_format)
+    """Parse RFC 3339 timestamp into naive datetime in UTC.
+
+    Fractions of seconds of any length (Alertmanager emits nanoseconds) are
+    truncated to microseconds, "Z" and numeric offsets are supported.
+    """
+    m = _rfc_3339_regex.match(timestamp)
+    if m is None:
+        raise ValueError(
+            "Invalid RFC 3339 timestamp: {!r}".format(timestamp))
+    (year, month, day, hour, minute, second,
+     fraction, sign, offset_hours, offset_minutes) = m.groups()
+    result = dt.datetime(
+        int(year), int(month), int(day), int(hour), int(minute), int(second),
+        int(fraction[:6].ljust(6, "0")) if fraction else 0)
+    if sign is None:
+        return result
+    offset = int(offset_hours) * 60 + int(offset_minutes)
+    if sign == "-":
+        offset = -offset
     try:
-        result = dt.datetime.strptime(timestamp, dt_format)
-    except ValueError:
-        result = dt.datetime.strptime(timestamp, dt_fallback_format)
-    return result
+        return result - dt.timedelta(minutes=offset)
+    except OverflowError:
+        return dt.datetime.min if offset > 0 else dt.datetime.max
 
 
 def wait_for_resource_status(resource_client, resource,